@@ -0,0 +1,128 @@
+"""
+API key authentication for service-to-service calls
+Implemented as plain ASGI middleware (no BaseHTTPMiddleware task/stream
+wrapping). Several keys can be active at once so they can be rotated, and
+the key file is re-read when it changes.
+
+Keys come from:
+    API_KEY        - a single key (original setting)
+    API_KEYS       - comma-separated list of keys
+    API_KEYS_FILE  - file with one key per line (# comments allowed)
+"""
+import hashlib
+import hmac
+import os
+import threading
+import time
+from typing import FrozenSet, Optional
+
+from starlette.responses import JSONResponse
+
+# Seconds between checks of API_KEYS_FILE for changes
+API_KEYS_RELOAD_INTERVAL = float(os.getenv("API_KEYS_RELOAD_INTERVAL", "10"))
+
+
+def _digest(key: str) -> bytes:
+    return hashlib.sha256(key.encode()).digest()
+
+
+class APIKeyRing:
+    """Set of SHA-256 digests of the accepted API keys"""
+
+    def __init__(self, keys_file: Optional[str] = None, reload_interval: float = API_KEYS_RELOAD_INTERVAL):
+        self.keys_file = keys_file
+        self.reload_interval = reload_interval
+        self._digests: FrozenSet[bytes] = frozenset()
+        self._file_mtime = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+        self.reload()
+
+    def reload(self):
+        """Re-read keys from the environment and the key file"""
+        keys = []
+        keys.append(os.environ.get("API_KEY", ""))
+        keys.extend(os.environ.get("API_KEYS", "").split(","))
+        mtime = None
+        if self.keys_file:
+            try:
+                mtime = os.stat(self.keys_file).st_mtime
+                with open(self.keys_file) as f:
+                    keys.extend(line.split("#", 1)[0] for line in f)
+            except FileNotFoundError:
+                pass
+        with self._lock:
+            self._digests = frozenset(_digest(key.strip()) for key in keys if key.strip())
+            self._file_mtime = mtime
+            self._checked_at = time.monotonic()
+
+    def _maybe_reload(self):
+        if not self.keys_file or time.monotonic() - self._checked_at < self.reload_interval:
+            return
+        try:
+            mtime = os.stat(self.keys_file).st_mtime
+        except FileNotFoundError:
+            mtime = None
+        if mtime != self._file_mtime:
+            self.reload()
+        else:
+            self._checked_at = time.monotonic()
+
+    @property
+    def enabled(self) -> bool:
+        self._maybe_reload()
+        return bool(self._digests)
+
+    def is_valid(self, key: Optional[str]) -> bool:
+        """Constant-time check against every active key"""
+        if not key:
+            return False
+        provided = _digest(key)
+        valid = False
+        for digest in self._digests:
+            valid |= hmac.compare_digest(provided, digest)
+        return valid
+
+
+class APIKeyMiddleware:
+    """Validate X-API-KEY for all /api/ routes except exempt paths (and prefixes) and OPTIONS"""
+
+    def __init__(self, app, keyring: APIKeyRing, exempt_paths=("/api/health",), exempt_prefixes=()):
+        self.app = app
+        self.keyring = keyring
+        self.exempt_paths = frozenset(exempt_paths)
+        self.exempt_prefixes = tuple(exempt_prefixes)
+
+    async def __call__(self, scope, receive, send):
+        # Skip validation for:
+        # - Non-HTTP traffic and non-API routes (static files, etc.)
+        # - Health check endpoint (for Azure monitoring)
+        # - Public, content-addressed files such as avatar variants (<img> can't send the key)
+        # - OPTIONS requests (CORS preflight)
+        # - When no API key is configured (local development)
+        if (
+            scope["type"] != "http" or
+            not scope["path"].startswith("/api/") or
+            scope["path"] in self.exempt_paths or
+            scope["path"].startswith(self.exempt_prefixes) or
+            scope["method"] == "OPTIONS" or
+            not self.keyring.enabled
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        provided_key = None
+        for name, value in scope["headers"]:
+            if name == b"x-api-key":
+                provided_key = value.decode("latin-1")
+                break
+
+        if not self.keyring.is_valid(provided_key):
+            response = JSONResponse(status_code=401, content={"detail": "Invalid or missing API key"})
+            await response(scope, receive, send)
+            return
+
+        await self.app(scope, receive, send)
+
+
+api_keyring = APIKeyRing(os.environ.get("API_KEYS_FILE") or None)
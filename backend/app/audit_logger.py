@@ -1,28 +1,251 @@
 """
 Audit Logger for Admin Actions
 Outputs JSON-formatted logs to stdout for Azure Container Apps Log Analytics
+
+Records are handed to a bounded in-memory queue on the request path and
+formatted/written in batches by a background thread, so emitting an audit
+event never does blocking I/O on the caller's thread. With AUDIT_STORE_DIR
+set, the same thread also appends each batch to the local store behind
+/api/audit (app/audit_store.py).
 """
+import atexit
 import logging
+import logging.handlers
+import os
+import queue
 import sys
+import threading
+import time
+from typing import Optional
 from pythonjsonlogger import jsonlogger
 
+from app import metrics
+from app.audit_store import FIELDS as STORE_FIELDS, AuditStore, audit_store
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional speedup
+    orjson = None
+
+# Maximum records buffered between the request path and the writer thread
+AUDIT_QUEUE_SIZE = int(os.getenv("AUDIT_QUEUE_SIZE", "10000"))
+# Maximum records formatted and written per batch
+AUDIT_BATCH_SIZE = int(os.getenv("AUDIT_BATCH_SIZE", "256"))
+# What to do when the queue is full: "drop" (counted, and reported by an
+# AUDIT_RECORDS_DROPPED record) or "block" (wait up to AUDIT_BLOCK_TIMEOUT).
+# Records are emitted on the event loop, so "block" stalls every request while it waits.
+AUDIT_OVERFLOW_POLICY = os.getenv("AUDIT_OVERFLOW_POLICY", "drop").lower()
+AUDIT_BLOCK_TIMEOUT = float(os.getenv("AUDIT_BLOCK_TIMEOUT", "5"))
+
+AUDIT_ENQUEUE_SECONDS = metrics.registry.histogram(
+    "audit_enqueue_seconds", "Time to hand an audit record to the writer queue")
+
+_json_default = jsonlogger.JsonEncoder().default
+
+
+def _orjson_dumps(obj, default=None, **kwargs):
+    return orjson.dumps(obj, default=default).decode()
+
+
+class AuditQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler with a bounded queue and a drop-or-block overflow policy"""
+
+    def __init__(self, record_queue: queue.Queue, policy: str, block_timeout: float):
+        super().__init__(record_queue)
+        self.policy = policy
+        self.block_timeout = block_timeout
+        self.dropped = 0
+        self._dropped_lock = threading.Lock()
+
+    def prepare(self, record):
+        # Formatting happens on the writer thread
+        return record
+
+    def enqueue(self, record):
+        if metrics.METRICS_ENABLED:
+            started = time.perf_counter()
+            self._enqueue(record)
+            AUDIT_ENQUEUE_SECONDS.observe(time.perf_counter() - started)
+        else:
+            self._enqueue(record)
+
+    def _enqueue(self, record):
+        try:
+            if self.policy == "block":
+                self.queue.put(record, timeout=self.block_timeout)
+            else:
+                self.queue.put_nowait(record)
+        except queue.Full:
+            with self._dropped_lock:
+                self.dropped += 1
+
+
+class BatchingQueueListener:
+    """Background thread that drains the audit queue and writes batches to a stream"""
+
+    _sentinel = None
+
+    def __init__(self, record_queue: queue.Queue, handler: AuditQueueHandler, formatter: logging.Formatter, stream, batch_size: int,
+                 store: Optional[AuditStore] = None):
+        self.queue = record_queue
+        self.handler = handler
+        self.formatter = formatter
+        self.stream = stream
+        self.batch_size = batch_size
+        self.store = store
+        self.written = 0
+        # Records that could not be formatted or written to the stream
+        self.failed = 0
+        self.batches = 0
+        self._reported_drops = 0
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="audit-writer", daemon=True)
+        self._thread.start()
+
+    def flush(self):
+        """Block until every record queued so far has been written"""
+        if self._thread is not None:
+            self.queue.join()
+
+    def stop(self):
+        """Flush everything still queued and stop the writer thread"""
+        if self._thread is None:
+            return
+        self.queue.put(self._sentinel)
+        self._thread.join()
+        self._thread = None
+        if self.store is not None:
+            self.store.close()
+
+    def _run(self):
+        while True:
+            batch = [self.queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            stopping = self._sentinel in batch
+            self._write([record for record in batch if record is not self._sentinel])
+            for _ in batch:
+                self.queue.task_done()
+            if stopping:
+                return
+
+    def _drop_notice(self):
+        """Audit record that reports drops since the last notice"""
+        dropped = self.handler.dropped
+        if dropped == self._reported_drops:
+            return None
+        newly_dropped = dropped - self._reported_drops
+        self._reported_drops = dropped
+        return audit_logger.makeRecord(
+            audit_logger.name, logging.WARNING, __file__, 0,
+            f"AUDIT: {newly_dropped} audit records dropped (queue full)", None, None,
+            extra={"Action": "AUDIT_RECORDS_DROPPED", "Dropped": newly_dropped, "Dropped_Total": dropped},
+        )
+
+    def _write(self, records):
+        notice = self._drop_notice()
+        if notice is not None:
+            records.append(notice)
+        if not records:
+            return
+        lines = []
+        stored = []
+        for record in records:
+            try:
+                line = self.formatter.format(record)
+            except Exception:
+                self.handler.handleError(record)
+                self.failed += 1
+                continue
+            lines.append(line)
+            if self.store is not None:
+                stored.append((record.created, [getattr(record, field, "") for field in STORE_FIELDS], line))
+        if lines:
+            try:
+                self.stream.write("\n".join(lines) + "\n")
+                self.stream.flush()
+                self.written += len(lines)
+            except Exception:
+                self.failed += len(lines)
+                sys.stderr.write(f"audit-writer: failed to write {len(lines)} audit records\n")
+        if stored:
+            try:
+                self.store.append(stored)
+            except Exception:
+                self.store.errors += 1
+                sys.stderr.write(f"audit-writer: failed to store {len(stored)} audit records\n")
+        self.batches += 1
+
+    def depth(self) -> int:
+        return self.queue.qsize()
+
+
 # Create audit logger
 audit_logger = logging.getLogger("audit")
 audit_logger.setLevel(logging.INFO)
+# Records go only through the batching writer below, never also to root
+# handlers (python -m app.server configures one on stderr)
+audit_logger.propagate = False
+audit_listener = None
 
 # Prevent duplicate handlers
 if not audit_logger.handlers:
-    # StreamHandler outputs to stdout (Azure Container Apps captures this)
-    handler = logging.StreamHandler(sys.stdout)
-    handler.setLevel(logging.INFO)
-    
-    # JSON formatter for structured logging
+    # JSON formatter for structured logging (orjson when available)
+    formatter_options = {"json_default": _json_default}
+    if orjson is not None:
+        formatter_options["json_serializer"] = _orjson_dumps
     formatter = jsonlogger.JsonFormatter(
         fmt='%(asctime)s %(levelname)s %(message)s',
-        datefmt='%Y-%m-%dT%H:%M:%S'
+        datefmt='%Y-%m-%dT%H:%M:%S',
+        **formatter_options
     )
-    handler.setFormatter(formatter)
+    
+    record_queue = queue.Queue(maxsize=AUDIT_QUEUE_SIZE)
+    handler = AuditQueueHandler(record_queue, AUDIT_OVERFLOW_POLICY, AUDIT_BLOCK_TIMEOUT)
+    handler.setLevel(logging.INFO)
     audit_logger.addHandler(handler)
+    
+    # Writer thread outputs to stdout (Azure Container Apps captures this)
+    audit_listener = BatchingQueueListener(
+        record_queue, handler, formatter, sys.stdout, AUDIT_BATCH_SIZE,
+        store=audit_store if audit_store.enabled else None,
+    )
+    audit_listener.start()
+
+
+def flush_audit_logging():
+    """Wait until all queued audit records have been written"""
+    if audit_listener is not None:
+        audit_listener.flush()
+
+
+def shutdown_audit_logging():
+    """Flush queued audit records and stop the writer; safe to call more than once"""
+    if audit_listener is not None:
+        audit_listener.stop()
+
+
+atexit.register(shutdown_audit_logging)
+
+
+def get_audit_metrics() -> dict:
+    """Queue depth and delivery counters for the audit pipeline"""
+    if audit_listener is None:
+        return {}
+    return {
+        "queue_depth": audit_listener.depth(),
+        "queue_capacity": audit_listener.queue.maxsize,
+        "overflow_policy": audit_listener.handler.policy,
+        "dropped": audit_listener.handler.dropped,
+        "written": audit_listener.written,
+        "failed": audit_listener.failed,
+        "batches": audit_listener.batches,
+    }
 
 def log_admin_action(
     admin_user: str,
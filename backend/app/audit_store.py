@@ -0,0 +1,491 @@
+"""
+Local audit event store
+Optional append-only sink next to stdout: with AUDIT_STORE_DIR set, the
+audit writer thread also appends every batch to a segment file there, so
+/api/audit can answer "what did X change last week" offline and without a
+Log Analytics round trip. The request path is unchanged (it only enqueues).
+
+A segment (.seg) is a run of frames: length, timestamp, the Admin_User,
+Action and Target_User values, then the JSON line as written to stdout.
+When it reaches AUDIT_SEGMENT_BYTES it is sealed with an index (.idx):
+frame offsets sorted by time plus, for every field value, the positions
+that carry it. Queries binary-search the time range and walk the shortest
+matching position list; data and index are memory-mapped.
+
+Each worker appends to its own segments. A background thread merges small
+sealed segments into ones of up to AUDIT_COMPACT_BYTES and deletes the
+oldest beyond AUDIT_STORE_MAX_BYTES.
+"""
+import fcntl
+import heapq
+import json
+import logging
+import mmap
+import os
+import secrets
+import struct
+import threading
+import time
+from array import array
+from bisect import bisect_left, bisect_right
+from itertools import islice
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Directory for audit segments (empty: no local store)
+AUDIT_STORE_DIR = os.getenv("AUDIT_STORE_DIR", "")
+# Size at which the segment being written is sealed and a new one started
+AUDIT_SEGMENT_BYTES = int(os.getenv("AUDIT_SEGMENT_BYTES", str(4 * 1024 * 1024)))
+# Sealed segments smaller than this are merged up to this size
+AUDIT_COMPACT_BYTES = int(os.getenv("AUDIT_COMPACT_BYTES", str(64 * 1024 * 1024)))
+# Oldest sealed segments are deleted once the store is larger than this
+AUDIT_STORE_MAX_BYTES = int(os.getenv("AUDIT_STORE_MAX_BYTES", str(1024 * 1024 * 1024)))
+
+FIELDS = ("Admin_User", "Action", "Target_User")
+# frame length, created (epoch seconds), byte length of each FIELDS value
+FRAME = struct.Struct("<Id3H")
+# Longer field values are indexed by their prefix
+MAX_KEY_CHARS = 256
+INDEX_VERSION = 1
+
+Frame = Tuple[float, int, Tuple[bytes, ...]]  # created, offset, field values
+
+
+def field_key(value) -> bytes:
+    return ("" if value is None else str(value))[:MAX_KEY_CHARS].encode()
+
+
+def encode_frame(created: float, keys: Sequence[bytes], line: bytes) -> bytes:
+    header = FRAME.pack(FRAME.size + sum(map(len, keys)) + len(line), created, *map(len, keys))
+    return b"".join((header, *keys, line))
+
+
+def read_frame(buf, offset: int):
+    """(end, created, keys, payload start) of the frame at offset, or None if it is incomplete"""
+    if offset + FRAME.size > len(buf):
+        return None
+    length, created, *lengths = FRAME.unpack_from(buf, offset)
+    end = offset + length
+    if length < FRAME.size or end > len(buf):
+        return None
+    keys = []
+    position = offset + FRAME.size
+    for size in lengths:
+        keys.append(bytes(buf[position:position + size]))
+        position += size
+    return end, created, tuple(keys), position
+
+
+def scan_frames(buf) -> Iterator[Frame]:
+    offset = 0
+    while True:
+        frame = read_frame(buf, offset)
+        if frame is None:
+            return
+        end, created, keys, _ = frame
+        yield created, offset, keys
+        offset = end
+
+
+def build_index(frames: Sequence[Frame], replaces: Sequence[str] = ()) -> bytes:
+    """Index for a segment's frames: a JSON header line, then times, offsets and posting lists"""
+    ordered = sorted(frames, key=lambda frame: frame[0])
+    times = array("d", (frame[0] for frame in ordered))
+    offsets = array("Q", (frame[1] for frame in ordered))
+    values: Dict[int, Dict[bytes, List[int]]] = {field: {} for field in range(len(FIELDS))}
+    for position, (_, _, keys) in enumerate(ordered):
+        for field, key in enumerate(keys):
+            values[field].setdefault(key, []).append(position)
+    positions = array("I")
+    postings = {}
+    for field, name in enumerate(FIELDS):
+        postings[name] = {}
+        for key, key_positions in values[field].items():
+            postings[name][key.decode(errors="replace")] = [len(positions), len(key_positions)]
+            positions.extend(key_positions)
+    header = json.dumps({
+        "version": INDEX_VERSION,
+        "count": len(ordered),
+        "min_ts": times[0] if ordered else 0.0,
+        "max_ts": times[-1] if ordered else 0.0,
+        "replaces": list(replaces),
+        "postings": postings,
+    }).encode()
+    # Pad so the arrays that follow are 8-byte aligned
+    header += b" " * (-(len(header) + 1) % 8) + b"\n"
+    return header + times.tobytes() + offsets.tobytes() + positions.tobytes()
+
+
+def _map(path: str) -> Optional[mmap.mmap]:
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return None
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+class Query:
+    def __init__(self, since: Optional[float] = None, until: Optional[float] = None, **filters: Optional[str]):
+        self.since = float("-inf") if since is None else since
+        self.until = float("inf") if until is None else until
+        # FIELDS index -> wanted value
+        self.filters = {FIELDS.index(name): field_key(value) for name, value in filters.items() if value is not None}
+
+    def matches(self, created: float, keys: Tuple[bytes, ...]) -> bool:
+        if not self.since <= created <= self.until:
+            return False
+        return all(keys[field] == value for field, value in self.filters.items())
+
+
+class Segment:
+    """A segment on disk; sealed ones have an index"""
+
+    def __init__(self, directory: str, name: str):
+        self.name = name
+        self.data_path = os.path.join(directory, name + ".seg")
+        self.index_path = os.path.join(directory, name + ".idx")
+        self.data: Optional[mmap.mmap] = None
+        self.index: Optional[mmap.mmap] = None
+        self.header: dict = {}
+
+    @property
+    def sealed(self) -> bool:
+        return self.index is not None
+
+    def open(self, sealed: bool):
+        self.data = _map(self.data_path)
+        if sealed:
+            self.index = _map(self.index_path)
+            newline = self.index.find(b"\n")
+            self.header = json.loads(self.index[:newline])
+            count = self.header["count"]
+            view = memoryview(self.index)[newline + 1:]
+            self.times = view[:8 * count].cast("d")
+            self.offsets = view[8 * count:16 * count].cast("Q")
+            self.positions = view[16 * count:].cast("I")
+        return self
+
+    def close(self):
+        if self.index is not None:
+            for view in (self.times, self.offsets, self.positions):
+                view.release()
+            self.index.close()
+        if self.data is not None:
+            self.data.close()
+
+    def size(self) -> int:
+        return sum(os.path.getsize(path) for path in (self.data_path, self.index_path) if os.path.exists(path))
+
+    def _payload(self, offset: int) -> Tuple[float, Tuple[bytes, ...], bytes]:
+        end, created, keys, start = read_frame(self.data, offset)
+        return created, keys, self.data[start:end]
+
+    def frames(self) -> Iterator[Tuple[float, int]]:
+        """(created, offset) of every frame, in time order"""
+        if self.data is None:
+            return
+        if self.sealed:
+            yield from zip(self.times, self.offsets)
+        else:
+            yield from sorted((created, offset) for created, offset, _ in scan_frames(self.data))
+
+    def find(self, query: Query) -> Iterator[Tuple[float, bytes]]:
+        """(created, JSON line) of matching events, in time order"""
+        if self.data is None:
+            return
+        if not self.sealed:
+            matches = sorted(
+                (created, offset) for created, offset, keys in scan_frames(self.data) if query.matches(created, keys)
+            )
+            for created, offset in matches:
+                yield created, self._payload(offset)[2]
+            return
+        header = self.header
+        if not header["count"] or header["max_ts"] < query.since or header["min_ts"] > query.until:
+            return
+        low = bisect_left(self.times, query.since)
+        high = bisect_right(self.times, query.until)
+        candidates = range(low, high)
+        for field, value in query.filters.items():
+            start, count = header["postings"][FIELDS[field]].get(value.decode(errors="replace"), (0, 0))
+            posting = self.positions[start:start + count]
+            # Positions are sorted, so the time range is a slice of the list
+            posting = posting[bisect_left(posting, low):bisect_left(posting, high)]
+            if len(posting) < len(candidates):
+                candidates = posting
+        for position in candidates:
+            created, keys, line = self._payload(self.offsets[position])
+            if query.matches(created, keys):
+                yield created, line
+
+
+class AuditStore:
+    """Append side for this process plus queries and compaction over the whole directory"""
+
+    def __init__(self, directory: str, segment_bytes: int = AUDIT_SEGMENT_BYTES,
+                 compact_bytes: int = AUDIT_COMPACT_BYTES, max_bytes: int = AUDIT_STORE_MAX_BYTES):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.compact_bytes = compact_bytes
+        self.max_bytes = max_bytes
+        self.appended = 0
+        self.sealed = 0
+        self.compactions = 0
+        self.deleted = 0
+        self.errors = 0
+        # Segment being written by this process; only the audit writer thread touches it
+        self._file = None
+        self._name: Optional[str] = None
+        self._frames: List[Frame] = []
+        self._compactor: Optional[threading.Thread] = None
+        self._compact_wanted = threading.Event()
+        self._stopping = False
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.directory)
+
+    def _path(self, name: str, ext: str) -> str:
+        return os.path.join(self.directory, name + ext)
+
+    def _start_segment(self):
+        os.makedirs(self.directory, exist_ok=True)
+        # Names sort by creation time; the token keeps workers apart
+        name = f"{int(time.time() * 1000):013d}-{secrets.token_hex(4)}"
+        # Created and locked under a name _segments() doesn't list, then renamed:
+        # _seal_abandoned must never see the segment before it is locked
+        tmp_path = self._path(name, ".seg.tmp")
+        file = open(tmp_path, "ab")
+        try:
+            # Held while this process writes the segment, so compaction leaves it alone
+            fcntl.flock(file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            os.rename(tmp_path, self._path(name, ".seg"))
+        except OSError:
+            file.close()
+            _unlink(tmp_path)
+            raise
+        self._name = name
+        self._file = file
+        self._frames = []
+        if self._compactor is None:
+            self._compactor = threading.Thread(target=self._compact_loop, name="audit-compactor", daemon=True)
+            self._compactor.start()
+            self._compact_wanted.set()
+
+    def append(self, entries: Sequence[Tuple[float, Sequence[object], str]]):
+        """Append (created, FIELDS values, JSON line) entries; called from the audit writer thread"""
+        if self._file is None:
+            self._start_segment()
+        offset = self._file.tell()
+        chunks = []
+        for created, values, line in entries:
+            keys = tuple(field_key(value) for value in values)
+            frame = encode_frame(created, keys, line.encode())
+            self._frames.append((created, offset, keys))
+            chunks.append(frame)
+            offset += len(frame)
+        self._file.write(b"".join(chunks))
+        self._file.flush()
+        self.appended += len(entries)
+        if offset >= self.segment_bytes:
+            self._seal()
+            self._compact_wanted.set()
+
+    def _seal(self):
+        if self._file is None:
+            return
+        if self._frames:
+            _write_atomic(self._path(self._name, ".idx"), build_index(self._frames))
+            self.sealed += 1
+            self._file.close()
+        else:
+            self._file.close()
+            os.unlink(self._path(self._name, ".seg"))
+        self._file = None
+        self._name = None
+        self._frames = []
+
+    def close(self):
+        """Seal the segment being written and stop compacting"""
+        self._seal()
+        self._stopping = True
+        self._compact_wanted.set()
+        if self._compactor is not None:
+            self._compactor.join(timeout=30)
+            self._compactor = None
+
+    def _segments(self) -> List[Tuple[str, bool]]:
+        """(name, sealed) of the segments on disk, oldest first"""
+        try:
+            files = set(os.listdir(self.directory))
+        except FileNotFoundError:
+            return []
+        return [
+            (file[:-4], file[:-4] + ".idx" in files)
+            for file in sorted(files) if file.endswith(".seg")
+        ]
+
+    def _open_segments(self) -> List[Segment]:
+        while True:
+            segments = []
+            try:
+                for name, sealed in self._segments():
+                    segments.append(Segment(self.directory, name).open(sealed))
+                break
+            except FileNotFoundError:
+                # Merged away since the listing; the merged segment is there now
+                for segment in segments:
+                    segment.close()
+        replaced = {name for segment in segments for name in segment.header.get("replaces", ())}
+        kept = []
+        for segment in segments:
+            if segment.name in replaced:
+                segment.close()
+            else:
+                kept.append(segment)
+        return kept
+
+    def query(self, since: Optional[float] = None, until: Optional[float] = None, limit: Optional[int] = None,
+              admin_user: Optional[str] = None, action: Optional[str] = None,
+              target_user: Optional[str] = None) -> Iterator[bytes]:
+        """JSON lines of matching events, oldest first (a sync generator: run it off the event loop)"""
+        query = Query(since, until, Admin_User=admin_user, Action=action, Target_User=target_user)
+        segments = self._open_segments()
+        finds = [segment.find(query) for segment in segments]
+        try:
+            for _, line in islice(heapq.merge(*finds, key=lambda match: match[0]), limit):
+                yield line
+        finally:
+            # Unfinished generators hold views into the maps
+            for find in finds:
+                find.close()
+            for segment in segments:
+                segment.close()
+
+    def _compact_loop(self):
+        while not self._stopping:
+            self._compact_wanted.wait()
+            self._compact_wanted.clear()
+            if self._stopping:
+                return
+            try:
+                self.compact()
+            except Exception:
+                self.errors += 1
+                logger.exception("Audit store compaction failed")
+
+    def compact(self):
+        """Seal abandoned segments, merge small sealed ones and apply the size limit"""
+        with open(self._path(".compact", ".lock"), "a") as lock:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                # Another worker is compacting the same directory
+                return
+            self._seal_abandoned()
+            self._merge_small()
+            self._apply_size_limit()
+
+    def _seal_abandoned(self):
+        """Index segments left unsealed by a worker that exited without closing them"""
+        for name, sealed in self._segments():
+            if sealed or name == self._name:
+                continue
+            with open(self._path(name, ".seg"), "rb") as f:
+                try:
+                    fcntl.flock(f, fcntl.LOCK_SH | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    continue  # still being written
+                data = f.read()
+            frames = list(scan_frames(data))
+            if frames:
+                _write_atomic(self._path(name, ".idx"), build_index(frames))
+            else:
+                os.unlink(self._path(name, ".seg"))
+
+    def _merge_small(self):
+        segments = [segment for segment in self._open_segments() if segment.sealed]
+        try:
+            groups, group, group_size = [], [], 0
+            for segment in segments:
+                size = segment.size()
+                if size >= self.compact_bytes or group_size + size > self.compact_bytes:
+                    groups.append(group)
+                    group, group_size = [], 0
+                if size < self.compact_bytes:
+                    group.append(segment)
+                    group_size += size
+            groups.append(group)
+            for group in groups:
+                if len(group) > 1:
+                    self._merge(group)
+        finally:
+            for segment in segments:
+                segment.close()
+
+    def _merge(self, group: List[Segment]):
+        name = f"{group[0].name.split('-')[0]}-{secrets.token_hex(4)}"
+        frames: List[Frame] = []
+        data_tmp = self._path(name, ".seg.tmp")
+        with open(data_tmp, "wb") as out:
+            ordered = heapq.merge(*(_tagged_frames(segment) for segment in group), key=lambda frame: frame[0])
+            for created, offset, segment in ordered:
+                end, _, keys, _ = read_frame(segment.data, offset)
+                frames.append((created, out.tell(), keys))
+                out.write(segment.data[offset:end])
+        # The index lands first, so readers never see the merged data unindexed;
+        # its "replaces" hides the inputs until they are deleted
+        _write_atomic(self._path(name, ".idx"), build_index(frames, [segment.name for segment in group]))
+        os.replace(data_tmp, self._path(name, ".seg"))
+        for segment in group:
+            _unlink(segment.index_path)
+            _unlink(segment.data_path)
+        self.compactions += 1
+
+    def _apply_size_limit(self):
+        sizes = []
+        for name, sealed in self._segments():
+            segment = Segment(self.directory, name)
+            sizes.append((segment, sealed, segment.size()))
+        total = sum(size for _, _, size in sizes)
+        for segment, sealed, size in sizes:
+            if total <= self.max_bytes:
+                return
+            if not sealed:
+                continue
+            _unlink(segment.index_path)
+            _unlink(segment.data_path)
+            total -= size
+            self.deleted += 1
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "appended": self.appended,
+            "sealed": self.sealed,
+            "compactions": self.compactions,
+            "deleted": self.deleted,
+            "errors": self.errors,
+        }
+
+
+def _tagged_frames(segment: Segment) -> Iterator[Tuple[float, int, Segment]]:
+    for created, offset in segment.frames():
+        yield created, offset, segment
+
+
+def _write_atomic(path: str, content: bytes):
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(content)
+    os.replace(tmp, path)
+
+
+def _unlink(path: str):
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
+
+
+audit_store = AuditStore(AUDIT_STORE_DIR)
@@ -0,0 +1,239 @@
+"""
+Avatar derivatives
+Resized square variants of content-addressed avatars, rendered lazily on
+first request in a worker pool and cached on disk (shared by all workers
+using the directory) with LRU eviction.
+
+Requires Pillow; without it no variants are advertised or served.
+"""
+import asyncio
+import fcntl
+import io
+import os
+import re
+import stat
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional, Tuple
+
+from app.metrics import run_in_threadpool
+
+try:
+    from PIL import Image, ImageOps, features
+except ImportError:  # pragma: no cover - optional dependency
+    Image = None
+
+# Square edge lengths (px) of the generated variants
+AVATAR_SIZES = tuple(int(s) for s in os.getenv("AVATAR_SIZES", "40,128,256").split(",") if s.strip())
+# Where rendered variants are cached and how much disk they may use
+AVATAR_CACHE_DIR = os.getenv("AVATAR_CACHE_DIR", os.path.join(os.getenv("UPLOAD_DIR", "uploads"), "derived"))
+AVATAR_CACHE_MAX_BYTES = int(os.getenv("AVATAR_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+# Seconds between refreshes of a cached variant's mtime, which orders LRU eviction
+AVATAR_CACHE_TOUCH_INTERVAL = float(os.getenv("AVATAR_CACHE_TOUCH_INTERVAL", "3600"))
+# Worker threads rendering variants (Pillow releases the GIL while resizing)
+AVATAR_WORKERS = int(os.getenv("AVATAR_WORKERS", "2"))
+
+AVATAR_URL_PREFIX = "/api/avatars"
+
+# A worker rescans the cache directory after writing 1/EVICTION_SLICES of
+# AVATAR_CACHE_MAX_BYTES, which bounds the overshoot across workers
+EVICTION_SLICES = 16
+
+# Content-addressed avatar names as produced by app.storage
+_AVATAR_NAME_RE = re.compile(r"^[0-9a-f]{64}(\.[a-z0-9]{1,8})?$")
+
+if Image is not None and features.check("webp"):
+    VARIANT_FORMAT, VARIANT_EXT, VARIANT_MEDIA_TYPE = "WEBP", "webp", "image/webp"
+else:
+    VARIANT_FORMAT, VARIANT_EXT, VARIANT_MEDIA_TYPE = "JPEG", "jpg", "image/jpeg"
+
+
+def variants_enabled() -> bool:
+    return Image is not None and bool(AVATAR_SIZES)
+
+
+def avatar_name(avatar_url: Optional[str]) -> Optional[str]:
+    """Stored avatar name from its URL, if it is content-addressed"""
+    if not avatar_url:
+        return None
+    name = avatar_url.rsplit("/", 1)[-1]
+    return name if _AVATAR_NAME_RE.match(name) else None
+
+
+def avatar_variants(avatar_url: Optional[str]) -> Optional[Dict[str, str]]:
+    """URLs of the resized variants of an avatar, keyed by edge length"""
+    name = avatar_name(avatar_url)
+    if name is None or not variants_enabled():
+        return None
+    return {str(size): f"{AVATAR_URL_PREFIX}/{name}/{size}.{VARIANT_EXT}" for size in AVATAR_SIZES}
+
+
+def render_variant(source: bytes, size: int) -> bytes:
+    """Center-crop and resize an image to size x size"""
+    with Image.open(io.BytesIO(source)) as image:
+        # Let JPEG decode at a reduced scale when it can
+        image.draft("RGB", (size * 2, size * 2))
+        image = ImageOps.exif_transpose(image)
+        if image.mode not in ("RGB", "RGBA"):
+            image = image.convert("RGBA" if "transparency" in image.info else "RGB")
+        if VARIANT_FORMAT == "JPEG" and image.mode == "RGBA":
+            image = image.convert("RGB")
+        image = ImageOps.fit(image, (size, size), Image.LANCZOS)
+        out = io.BytesIO()
+        image.save(out, VARIANT_FORMAT, quality=80)
+        return out.getvalue()
+
+
+class DerivativeCache:
+    """
+    On-disk cache of rendered variants, shared by every worker using the
+    directory. The files themselves are the index: a lookup stats the file,
+    and eviction scans the directory, removing the least recently used
+    (oldest mtime; hits refresh it) until it fits in max_bytes.
+    """
+
+    def __init__(self, root: str, max_bytes: int, touch_interval: float = AVATAR_CACHE_TOUCH_INTERVAL):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.touch_interval = touch_interval
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # Directory contents as of the last scan
+        self._files = 0
+        self._bytes = 0
+        # Bytes this process wrote since it last scanned; None until the first scan
+        self._written_since_scan = None
+        self._lock = threading.Lock()
+
+    def path_for(self, name: str, size: int) -> str:
+        return os.path.join(self.root, f"{name}-{size}.{VARIANT_EXT}")
+
+    def get(self, path: str) -> Optional[os.stat_result]:
+        """stat of a cached variant, or None; marks it recently used (call from a worker thread)"""
+        try:
+            stat_result = os.stat(path)
+        except FileNotFoundError:
+            with self._lock:
+                self.misses += 1
+            return None
+        if time.time() - stat_result.st_mtime > self.touch_interval:
+            try:
+                os.utime(path)
+                stat_result = os.stat(path)
+            except FileNotFoundError:
+                # Evicted by another worker meanwhile
+                with self._lock:
+                    self.misses += 1
+                return None
+        with self._lock:
+            self.hits += 1
+        return stat_result
+
+    def put(self, path: str, data: bytes):
+        """Write a variant atomically and evict old ones (call from a worker thread)"""
+        os.makedirs(self.root, exist_ok=True)
+        tmp_path = os.path.join(self.root, f".tmp-{uuid.uuid4().hex}")
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        with self._lock:
+            # Rescan once the writes of this process could have used up a
+            # slice of the budget (and on the first write)
+            due = self._written_since_scan is None or self._written_since_scan + len(data) > self.max_bytes // EVICTION_SLICES
+            self._written_since_scan = (self._written_since_scan or 0) + len(data)
+        if due:
+            self.evict()
+
+    def evict(self):
+        """Scan the directory and remove the least recently used variants past max_bytes"""
+        with open(os.path.join(self.root, ".evict.lock"), "a") as lock:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                # Another worker is evicting from the same directory
+                return
+            entries = []
+            for entry in os.scandir(self.root):
+                if entry.name.startswith("."):
+                    continue
+                try:
+                    stat_result = entry.stat()
+                except FileNotFoundError:
+                    continue
+                if stat.S_ISREG(stat_result.st_mode):
+                    entries.append((stat_result.st_mtime, entry.path, stat_result.st_size))
+            entries.sort()
+            total = sum(size for _, _, size in entries)
+            evicted = 0
+            # Oldest first, always keeping the newest file
+            for _, path, size in entries[:-1]:
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                    evicted += 1
+                except FileNotFoundError:
+                    pass
+                total -= size
+        with self._lock:
+            self._files = len(entries) - evicted
+            self._bytes = total
+            self._written_since_scan = 0
+            self.evictions += evicted
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "files": self._files,
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+derivative_cache = DerivativeCache(AVATAR_CACHE_DIR, AVATAR_CACHE_MAX_BYTES)
+_executor = ThreadPoolExecutor(max_workers=AVATAR_WORKERS, thread_name_prefix="avatar")
+# Renders in progress, so concurrent requests for one variant share the work
+_pending: Dict[str, asyncio.Future] = {}
+
+
+def _render_and_store(source: bytes, size: int, path: str):
+    derivative_cache.put(path, render_variant(source, size))
+
+
+async def get_variant(storage, name: str, size: int) -> Optional[Tuple[str, os.stat_result]]:
+    """
+    Path and stat of a cached variant, rendering it first if needed.
+
+    Returns None when variants are disabled, the size is not offered, the
+    avatar does not exist or it is not a decodable image.
+    """
+    if not variants_enabled() or size not in AVATAR_SIZES or not _AVATAR_NAME_RE.match(name):
+        return None
+    path = derivative_cache.path_for(name, size)
+    # Two rounds: a variant rendered here may be evicted by another worker before the stat
+    for _ in range(2):
+        stat_result = await run_in_threadpool(derivative_cache.get, path)
+        if stat_result is not None:
+            return path, stat_result
+
+        pending = _pending.get(path)
+        if pending is None:
+            source = await storage.read(f"avatars/{name}")
+            if source is None:
+                return None
+            pending = _pending.get(path)
+            if pending is None:
+                loop = asyncio.get_running_loop()
+                pending = asyncio.ensure_future(loop.run_in_executor(_executor, _render_and_store, source, size, path))
+                _pending[path] = pending
+                pending.add_done_callback(lambda _: _pending.pop(path, None))
+        try:
+            await asyncio.shield(pending)
+        except Exception:
+            return None
+    return None
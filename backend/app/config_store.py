@@ -0,0 +1,108 @@
+"""
+In-memory SystemConfig snapshot
+Config reads are served from an immutable snapshot that is rebuilt only
+after a write by this process or a sibling worker (broadcast through
+app/coordination.py), or when another replica's write moves the table
+watermark (checked at most every CONFIG_CHECK_INTERVAL seconds).
+"""
+import hashlib
+import os
+import time
+from dataclasses import dataclass
+from types import MappingProxyType
+from typing import Mapping, Optional, Tuple
+
+from sqlalchemy import select, func
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.user import SystemConfig
+from app.schemas import ConfigResponse
+from app.serialization import config_list_adapter
+
+# Seconds between watermark checks for writes made by other replicas
+CONFIG_CHECK_INTERVAL = float(os.getenv("CONFIG_CHECK_INTERVAL", "5"))
+
+
+@dataclass(frozen=True)
+class ConfigSnapshot:
+    items: Tuple[ConfigResponse, ...]
+    by_key: Mapping[str, ConfigResponse]
+    watermark: tuple
+    etag: str
+    # items encoded once, served as-is by the list endpoint
+    body: bytes
+
+
+async def _watermark(db: AsyncSession) -> tuple:
+    """Row count, highest id and total of row versions; changes whenever the table does"""
+    row = (await db.execute(
+        select(func.count(SystemConfig.id), func.max(SystemConfig.id), func.sum(SystemConfig.row_version))
+    )).one()
+    return tuple(row)
+
+
+class ConfigStore:
+    def __init__(self, check_interval: float):
+        self.check_interval = check_interval
+        self.rebuilds = 0
+        self._snapshot: Optional[ConfigSnapshot] = None
+        self._checked_at = 0.0
+        self._generation = 0
+        self._listeners = []
+        self._invalidation_listeners = []
+
+    def subscribe(self, listener):
+        """Call listener(snapshot.by_key) whenever a new snapshot is published"""
+        self._listeners.append(listener)
+
+    async def get(self, db: AsyncSession) -> ConfigSnapshot:
+        """Return the current snapshot, rebuilding it if stale"""
+        snapshot = self._snapshot
+        now = time.monotonic()
+        if snapshot is None:
+            return await self._rebuild(db)
+        if now - self._checked_at >= self.check_interval:
+            self._checked_at = now
+            if await _watermark(db) != snapshot.watermark:
+                return await self._rebuild(db)
+        return snapshot
+
+    def on_invalidate(self, listener):
+        """Call listener() after every invalidate(), e.g. to tell other workers"""
+        self._invalidation_listeners.append(listener)
+
+    def invalidate(self):
+        """Drop the snapshot after a local write"""
+        self.invalidate_local()
+        for listener in self._invalidation_listeners:
+            listener()
+
+    def invalidate_local(self):
+        """invalidate() without notifying listeners (for invalidations received from elsewhere)"""
+        self._snapshot = None
+        self._generation += 1
+
+    async def _rebuild(self, db: AsyncSession) -> ConfigSnapshot:
+        generation = self._generation
+        watermark = await _watermark(db)
+        rows = (await db.scalars(select(SystemConfig).order_by(SystemConfig.id))).all()
+        items = tuple(ConfigResponse.model_validate(row) for row in rows)
+        body = config_list_adapter.dump_json(items)
+        snapshot = ConfigSnapshot(
+            items=items,
+            by_key=MappingProxyType({item.key: item for item in items}),
+            watermark=watermark,
+            etag='"%s"' % hashlib.sha256(body).hexdigest()[:32],
+            body=body,
+        )
+        # Don't publish a snapshot that a concurrent write already invalidated
+        if generation == self._generation:
+            self._snapshot = snapshot
+            for listener in self._listeners:
+                listener(snapshot.by_key)
+        self._checked_at = time.monotonic()
+        self.rebuilds += 1
+        return snapshot
+
+
+config_store = ConfigStore(CONFIG_CHECK_INTERVAL)
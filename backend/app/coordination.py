@@ -0,0 +1,405 @@
+"""
+Coordination between worker processes
+Each worker started by app/server.py holds its own caches, config snapshot
+and rate-limit counters. This layer keeps them in step:
+
+    publish/subscribe  - invalidation broadcast to every other worker
+    hit/reset/incr     - counters shared by all workers
+    workers            - live workers and their last heartbeat (for /api/health)
+
+Backends (COORDINATION_BACKEND):
+    local         - single process: nothing to broadcast, counters in memory (default)
+    unix          - client of the hub the launcher serves on COORDINATION_SOCKET
+    module:Class  - any Coordinator subclass, e.g. one on Redis pub/sub when
+                    replicas on several hosts must share state
+"""
+import asyncio
+import importlib
+import itertools
+import json
+import logging
+import os
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import defaultdict
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Which coordinator backend to use: local | unix | module:Class
+COORDINATION_BACKEND = os.getenv("COORDINATION_BACKEND", "local")
+# Unix socket the launcher's hub listens on (set by app/server.py)
+COORDINATION_SOCKET = os.getenv("COORDINATION_SOCKET", "")
+# Seconds between worker heartbeats; workers silent for three are reported stale
+COORDINATION_HEARTBEAT = float(os.getenv("COORDINATION_HEARTBEAT", "5"))
+# Seconds to wait for the hub before answering from local state
+COORDINATION_TIMEOUT = float(os.getenv("COORDINATION_TIMEOUT", "1"))
+
+# Delivered locally after reconnecting to the hub, since broadcasts may have been missed
+RECONNECTED = "coordination.reconnected"
+
+# Longest protocol line accepted, and bytes queued for a worker that stopped reading
+MAX_LINE = 1024 * 1024
+MAX_BUFFER = 4 * 1024 * 1024
+
+
+def _encode(message: dict) -> bytes:
+    return json.dumps(message, separators=(",", ":")).encode() + b"\n"
+
+
+class Coordinator(ABC):
+    """Interface for coordination backends"""
+
+    def __init__(self):
+        self.pid = os.getpid()
+        self._subscribers: Dict[str, List[Callable[[Any], None]]] = defaultdict(list)
+
+    def subscribe(self, channel: str, callback: Callable[[Any], None]):
+        """Call callback(data) for each message another worker publishes on channel"""
+        self._subscribers[channel].append(callback)
+
+    @abstractmethod
+    def publish(self, channel: str, data: Any = None):
+        """Send data (JSON-serializable) to channel's subscribers in every other worker; never blocks"""
+
+    @abstractmethod
+    async def hit(self, key: str, limit: int, window: float) -> Optional[float]:
+        """RateLimiter.hit against counters shared by all workers (see app/rate_limit.py)"""
+
+    @abstractmethod
+    async def reset(self, key: str):
+        """RateLimiter.reset for the shared counters"""
+
+    @abstractmethod
+    async def incr(self, key: str, amount: int = 1) -> int:
+        """Add amount to a shared counter and return the new value"""
+
+    @abstractmethod
+    async def workers(self) -> List[dict]:
+        """Live workers as {"pid", "age"}, age being seconds since the last heartbeat"""
+
+    async def start(self):
+        pass
+
+    async def stop(self):
+        pass
+
+    def status(self) -> dict:
+        return {"backend": type(self).__name__, "connected": True}
+
+    def _deliver(self, channel: str, data: Any):
+        for callback in self._subscribers.get(channel, ()):
+            try:
+                callback(data)
+            except Exception:
+                logger.exception("Coordination subscriber for %s failed", channel)
+
+
+class LocalCoordinator(Coordinator):
+    """Single process: no other workers to tell, counters kept in memory"""
+
+    def __init__(self):
+        super().__init__()
+        self.counters: Dict[str, int] = defaultdict(int)
+        self._limiter = None
+
+    @property
+    def limiter(self):
+        if self._limiter is None:
+            # Imported here: app.rate_limit may be what is importing this module
+            from app.rate_limit import RATE_LIMIT_MAX_KEYS, MemoryRateLimiter
+            self._limiter = MemoryRateLimiter(RATE_LIMIT_MAX_KEYS)
+        return self._limiter
+
+    def publish(self, channel: str, data: Any = None):
+        pass
+
+    async def hit(self, key: str, limit: int, window: float) -> Optional[float]:
+        return await self.limiter.hit(key, limit, window)
+
+    async def reset(self, key: str):
+        await self.limiter.reset(key)
+
+    async def incr(self, key: str, amount: int = 1) -> int:
+        self.counters[key] += amount
+        return self.counters[key]
+
+    async def workers(self) -> List[dict]:
+        return [{"pid": self.pid, "age": 0.0}]
+
+
+class UnixSocketCoordinator(Coordinator):
+    """
+    Client of the launcher's CoordinationHub (line-delimited JSON over a
+    Unix socket). Reconnects with backoff; while the hub is unreachable,
+    broadcasts are dropped and counters are answered from local state.
+    """
+
+    def __init__(self, path: str):
+        super().__init__()
+        self.path = path
+        self.fallback = LocalCoordinator()
+        self.dropped = 0
+        self.fallbacks = 0
+        self.reconnects = 0
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread: Optional[int] = None
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._pending: Dict[int, asyncio.Future] = {}
+        self._ids = itertools.count(1)
+        self._tasks: List[asyncio.Task] = []
+        self._attempted = asyncio.Event()
+        self._missed = False
+
+    async def start(self):
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread = threading.get_ident()
+        self._tasks = [asyncio.create_task(self._run()), asyncio.create_task(self._heartbeat())]
+        # Serve with fallbacks rather than delay startup if the hub is not up yet
+        try:
+            await asyncio.wait_for(self._attempted.wait(), COORDINATION_TIMEOUT)
+        except asyncio.TimeoutError:
+            pass
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _run(self):
+        delay = 0.1
+        while True:
+            try:
+                reader, writer = await asyncio.open_unix_connection(self.path, limit=MAX_LINE)
+            except OSError as exc:
+                if not self._missed:
+                    logger.warning("Coordination hub %s unreachable (%s); using local state", self.path, exc)
+                self._missed = True
+                self._attempted.set()
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 5.0)
+                continue
+
+            writer.write(_encode({"op": "hello", "pid": self.pid}))
+            self._writer = writer
+            self._attempted.set()
+            delay = 0.1
+            if self._missed:
+                self.reconnects += 1
+                logger.info("Connected to coordination hub %s", self.path)
+                self._deliver(RECONNECTED, None)
+            try:
+                await self._read(reader)
+            except (OSError, ValueError) as exc:
+                logger.warning("Coordination hub connection failed: %s", exc)
+            finally:
+                self._writer = None
+                writer.close()
+                for future in self._pending.values():
+                    if not future.done():
+                        future.set_exception(ConnectionError("coordination hub disconnected"))
+                self._pending.clear()
+            self._missed = True
+
+    async def _read(self, reader: asyncio.StreamReader):
+        while True:
+            line = await reader.readline()
+            if not line:
+                return
+            message = json.loads(line)
+            if "id" in message:
+                future = self._pending.pop(message["id"], None)
+                if future is not None and not future.done():
+                    future.set_result(message["result"])
+            else:
+                self._deliver(message["channel"], message.get("data"))
+
+    async def _heartbeat(self):
+        while True:
+            await asyncio.sleep(COORDINATION_HEARTBEAT)
+            if self._writer is not None:
+                self._writer.write(_encode({"op": "heartbeat"}))
+
+    def _write(self, data: bytes):
+        writer = self._writer
+        if writer is None or writer.is_closing():
+            self.dropped += 1
+            return
+        writer.write(data)
+
+    def publish(self, channel: str, data: Any = None):
+        if self._loop is None:
+            self.dropped += 1
+            return
+        data = _encode({"op": "publish", "channel": channel, "data": data})
+        # Sync endpoints invalidate from threadpool threads
+        if threading.get_ident() == self._loop_thread:
+            self._write(data)
+        else:
+            self._loop.call_soon_threadsafe(self._write, data)
+
+    async def _request(self, message: dict) -> Any:
+        if self._writer is None:
+            raise ConnectionError("coordination hub not connected")
+        message["id"] = request_id = next(self._ids)
+        future = self._loop.create_future()
+        self._pending[request_id] = future
+        self._writer.write(_encode(message))
+        try:
+            return await asyncio.wait_for(future, COORDINATION_TIMEOUT)
+        finally:
+            self._pending.pop(request_id, None)
+
+    async def _call(self, op: str, **params) -> Any:
+        """Ask the hub, or answer from local state when it can't be reached"""
+        try:
+            return await self._request(dict(params, op=op))
+        except (ConnectionError, asyncio.TimeoutError):
+            self.fallbacks += 1
+            return await getattr(self.fallback, op)(**params)
+
+    async def hit(self, key: str, limit: int, window: float) -> Optional[float]:
+        return await self._call("hit", key=key, limit=limit, window=window)
+
+    async def reset(self, key: str):
+        await self._call("reset", key=key)
+
+    async def incr(self, key: str, amount: int = 1) -> int:
+        return await self._call("incr", key=key, amount=amount)
+
+    async def workers(self) -> List[dict]:
+        return await self._call("workers")
+
+    def status(self) -> dict:
+        return dict(
+            super().status(),
+            connected=self._writer is not None,
+            dropped=self.dropped,
+            fallbacks=self.fallbacks,
+            reconnects=self.reconnects,
+        )
+
+
+class CoordinationHub:
+    """
+    Runs in the launcher process (app/server.py) on its own thread and event
+    loop: relays published messages to every other worker, keeps the shared
+    counters and tracks worker heartbeats.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.state = LocalCoordinator()
+        self._clients: Dict[asyncio.StreamWriter, dict] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._ready = threading.Event()
+        self._error: Optional[BaseException] = None
+
+    def start(self):
+        """Serve from a daemon thread; returns once the socket is listening"""
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        self._thread = threading.Thread(target=self._serve, name="coordination-hub", daemon=True)
+        self._thread.start()
+        self._ready.wait()
+        if self._error is not None:
+            raise self._error
+
+    def stop(self):
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join(timeout=5)
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+
+    def _serve(self):
+        loop = self._loop = asyncio.new_event_loop()
+        try:
+            server = loop.run_until_complete(asyncio.start_unix_server(self._handle, path=self.path, limit=MAX_LINE))
+        except Exception as exc:
+            self._error = exc
+            self._ready.set()
+            return
+        self._ready.set()
+        try:
+            loop.run_forever()
+        finally:
+            server.close()
+            loop.close()
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        client = self._clients[writer] = {"pid": None, "seen": time.monotonic()}
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                client["seen"] = time.monotonic()
+                try:
+                    await self._dispatch(json.loads(line), writer, client)
+                except (ValueError, KeyError, TypeError) as exc:
+                    logger.warning("Bad coordination message from worker %s: %r", client["pid"], exc)
+        except (OSError, ValueError) as exc:
+            logger.warning("Coordination connection from worker %s failed: %s", client["pid"], exc)
+        finally:
+            del self._clients[writer]
+            writer.close()
+
+    async def _dispatch(self, message: dict, writer: asyncio.StreamWriter, client: dict):
+        op = message["op"]
+        if op == "publish":
+            self._broadcast(writer, _encode({"op": "message", "channel": message["channel"], "data": message.get("data")}))
+            return
+        if op == "hello":
+            client["pid"] = message["pid"]
+            return
+        if op == "heartbeat":
+            return
+
+        if op == "hit":
+            result = await self.state.hit(message["key"], message["limit"], message["window"])
+        elif op == "reset":
+            result = await self.state.reset(message["key"])
+        elif op == "incr":
+            result = await self.state.incr(message["key"], message.get("amount", 1))
+        elif op == "workers":
+            result = self.workers()
+        else:
+            raise KeyError(op)
+        writer.write(_encode({"id": message["id"], "result": result}))
+
+    def _broadcast(self, sender: asyncio.StreamWriter, data: bytes):
+        for writer, client in list(self._clients.items()):
+            if writer is sender or writer.is_closing():
+                continue
+            if writer.transport.get_write_buffer_size() > MAX_BUFFER:
+                # A stuck worker must not grow the hub without bound; it resyncs on reconnect
+                logger.warning("Disconnecting worker %s: not reading coordination messages", client["pid"])
+                writer.close()
+                continue
+            writer.write(data)
+
+    def workers(self) -> List[dict]:
+        now = time.monotonic()
+        return sorted(
+            ({"pid": client["pid"], "age": round(now - client["seen"], 3)}
+             for client in self._clients.values() if client["pid"] is not None),
+            key=lambda worker: worker["pid"],
+        )
+
+
+def create_coordinator(backend: str = COORDINATION_BACKEND) -> Coordinator:
+    if ":" in backend:
+        module_name, class_name = backend.split(":", 1)
+        return getattr(importlib.import_module(module_name), class_name)()
+    if backend == "unix":
+        return UnixSocketCoordinator(COORDINATION_SOCKET)
+    return LocalCoordinator()
+
+
+coordinator = create_coordinator()
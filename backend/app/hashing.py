@@ -0,0 +1,136 @@
+"""
+Password hashing off the request path
+bcrypt runs in a dedicated, bounded thread pool (the bcrypt C extension
+releases the GIL) so a login burst cannot starve the request threadpool.
+"""
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
+
+from functools import lru_cache
+
+from fastapi import HTTPException, status
+
+from app import metrics
+
+# bcrypt cost factor; stored hashes below it are upgraded on the next login
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+# Worker threads dedicated to hashing
+HASH_WORKERS = int(os.getenv("HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+# Hash jobs allowed to wait for a worker before requests are rejected with 503
+HASH_QUEUE_SIZE = int(os.getenv("HASH_QUEUE_SIZE", "64"))
+
+HASH_QUEUE_WAIT = metrics.registry.histogram(
+    "bcrypt_queue_wait_seconds", "Time hash jobs wait for a hashing worker", ("op",))
+HASH_DURATION = metrics.registry.histogram(
+    "bcrypt_duration_seconds", "Time spent hashing or verifying a password", ("op",))
+
+@lru_cache(maxsize=None)
+def get_pwd_context():
+    # Imported lazily: passlib is only needed once a password is checked
+    from passlib.context import CryptContext
+    return CryptContext(
+        schemes=["bcrypt"],
+        deprecated="auto",
+        bcrypt__rounds=BCRYPT_ROUNDS,
+        bcrypt__min_rounds=BCRYPT_ROUNDS,
+    )
+
+
+class HashingPool:
+    """Thread pool with a bounded backlog; submissions fail fast when full"""
+
+    def __init__(self, workers: int, queue_size: int):
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bcrypt")
+        self._slots = threading.BoundedSemaphore(workers + queue_size)
+        self.rejected = 0
+
+    async def run(self, fn, *args, op: str = "hash"):
+        if not self._slots.acquire(blocking=False):
+            self.rejected += 1
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Authentication service is busy, please retry",
+                headers={"Retry-After": "1"},
+            )
+        if metrics.METRICS_ENABLED:
+            fn = _timed(fn, op)
+        try:
+            future = self._executor.submit(fn, *args)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return await asyncio.wrap_future(future)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=True)
+
+
+def _timed(fn, op: str):
+    """Wrap a hash job to record its queue wait and run time"""
+    submitted = time.perf_counter()
+
+    def job(*args):
+        started = time.perf_counter()
+        HASH_QUEUE_WAIT.observe(started - submitted, op)
+        try:
+            return fn(*args)
+        finally:
+            HASH_DURATION.observe(time.perf_counter() - started, op)
+
+    return job
+
+
+hashing_pool = HashingPool(HASH_WORKERS, HASH_QUEUE_SIZE)
+metrics.registry.gauge("bcrypt_rejected_total", "Hash jobs rejected because the queue was full",
+                       lambda: hashing_pool.rejected, kind="counter")
+
+
+def _verify_and_update(plain_password: str, hashed_password: str):
+    # Truncate to 72 bytes (bcrypt limit)
+    return get_pwd_context().verify_and_update(plain_password[:72], hashed_password)
+
+
+def _hash(password: str) -> str:
+    # Truncate to 72 bytes (bcrypt limit)
+    return get_pwd_context().hash(password[:72])
+
+
+def _hash_many(passwords: List[str]) -> List[str]:
+    return [_hash(password) for password in passwords]
+
+
+async def verify_password_async(plain_password: str, hashed_password: str):
+    """
+    Verify a password on the hashing pool.
+
+    Returns:
+        (valid, new_hash) where new_hash is set when the stored hash uses an
+        outdated cost factor and should be replaced.
+    """
+    return await hashing_pool.run(_verify_and_update, plain_password, hashed_password, op="verify")
+
+
+async def hash_password_async(password: str) -> str:
+    """Hash a password on the hashing pool"""
+    return await hashing_pool.run(_hash, password, op="hash")
+
+
+async def hash_passwords_async(passwords: List[str]) -> List[str]:
+    """
+    Hash a batch of passwords for bulk imports.
+
+    The batch is split into at most half the hashing workers' worth of jobs
+    (one pool slot each), so an import leaves room for interactive logins.
+    """
+    if not passwords:
+        return []
+    jobs = max(1, min(len(passwords), HASH_WORKERS // 2))
+    size = -(-len(passwords) // jobs)
+    chunks = [passwords[i:i + size] for i in range(0, len(passwords), size)]
+    results = await asyncio.gather(*(hashing_pool.run(_hash_many, chunk, op="hash_batch") for chunk in chunks))
+    return [hashed for chunk in results for hashed in chunk]
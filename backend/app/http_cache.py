@@ -0,0 +1,207 @@
+"""
+Conditional GET and negotiated compression
+Endpoints that clients poll send a strong ETag derived from row versions
+(users) or the pre-encoded snapshot (config), and answer a matching
+If-None-Match with 304 before encoding anything. CompressionMiddleware
+compresses JSON/NDJSON responses of at least COMPRESSION_MIN_SIZE bytes
+with brotli (when the brotli package is installed) or gzip, whichever the
+client's Accept-Encoding prefers.
+"""
+import hashlib
+import os
+import zlib
+from typing import Optional
+
+from fastapi import Request, Response
+from starlette.datastructures import Headers, MutableHeaders
+
+from app.serialization import NDJSON_MEDIA_TYPE
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - optional, gzip is offered instead
+    brotli = None
+
+# Smallest response body worth compressing (0 disables compression)
+COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", "1024"))
+# Compression levels; the defaults favour CPU over the last few percent of size
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", "6"))
+BROTLI_QUALITY = int(os.getenv("BROTLI_QUALITY", "4"))
+
+COMPRESSIBLE_TYPES = ("application/json", NDJSON_MEDIA_TYPE, "text/")
+
+# Clients keep the response but revalidate it (If-None-Match) on every use
+CACHE_CONTROL = "private, no-cache"
+
+_stats = {"not_modified": 0, "compressed": 0, "bytes_in": 0, "bytes_out": 0}
+
+
+def stats() -> dict:
+    return dict(_stats, brotli=brotli is not None)
+
+
+def make_etag(*parts) -> str:
+    """Strong ETag over the given values (bytes, or anything str() can encode)"""
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(part if isinstance(part, bytes) else str(part).encode())
+        digest.update(b"\0")
+    return '"%s"' % digest.hexdigest()[:32]
+
+
+def _opaque_tag(tag: str) -> str:
+    """tag without W/ or the coding suffix CompressionMiddleware appended"""
+    tag = tag.strip()
+    if tag.startswith("W/"):
+        tag = tag[2:]
+    # Either coding: the response may have come from a worker with brotli installed
+    for coding in ("br", "gzip"):
+        suffix = f'-{coding}"'
+        if tag.endswith(suffix):
+            return tag[:-len(suffix)] + '"'
+    return tag
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """Whether If-None-Match lists etag (weak comparison, as GET requires)"""
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return any(_opaque_tag(tag) == etag for tag in if_none_match.split(","))
+
+
+def not_modified(etag: str, headers: Optional[dict] = None) -> Response:
+    _stats["not_modified"] += 1
+    return Response(status_code=304, headers={"ETag": etag, "Cache-Control": CACHE_CONTROL, **(headers or {})})
+
+
+class _GzipEncoder:
+    def __init__(self):
+        self._compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+
+    def encode(self, data: bytes, final: bool) -> bytes:
+        out = self._compressor.compress(data)
+        if final:
+            return out + self._compressor.flush()
+        # Flush what each chunk produced so streamed responses keep streaming
+        return out + self._compressor.flush(zlib.Z_SYNC_FLUSH) if data else out
+
+
+class _BrotliEncoder:
+    def __init__(self):
+        self._compressor = brotli.Compressor(mode=brotli.MODE_TEXT, quality=BROTLI_QUALITY)
+
+    def encode(self, data: bytes, final: bool) -> bytes:
+        out = self._compressor.process(data)
+        if final:
+            return out + self._compressor.finish()
+        return out + self._compressor.flush() if data else out
+
+
+# Codings offered, most preferred first
+_ENCODERS = {"br": _BrotliEncoder, "gzip": _GzipEncoder} if brotli is not None else {"gzip": _GzipEncoder}
+
+
+def negotiate_encoding(accept_encoding: str) -> Optional[str]:
+    """The coding to use for this Accept-Encoding, or None for identity"""
+    weights = {}
+    for item in accept_encoding.split(","):
+        coding, _, params = item.partition(";")
+        weight = 1.0
+        params = params.strip().lower()
+        if params.startswith("q="):
+            try:
+                weight = float(params[2:])
+            except ValueError:
+                weight = 0.0
+        weights[coding.strip().lower()] = weight
+    best, best_weight = None, 0.0
+    for coding in _ENCODERS:
+        weight = weights.get(coding, weights.get("*", 0.0))
+        if weight > best_weight:
+            best, best_weight = coding, weight
+    return best
+
+
+class CompressionMiddleware:
+    """
+    Compresses compressible responses for clients that accept it. Whole
+    bodies below minimum_size are sent as-is; streamed bodies are
+    compressed chunk by chunk. ETags get a -<coding> suffix, since the
+    compressed bytes are a different representation; etag_matches()
+    ignores it.
+    """
+
+    def __init__(self, app, minimum_size: int = COMPRESSION_MIN_SIZE):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or self.minimum_size <= 0:
+            await self.app(scope, receive, send)
+            return
+
+        coding = negotiate_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        start_message = None
+        encoder = None
+
+        async def compressing_send(message):
+            nonlocal start_message, encoder
+            if message["type"] == "http.response.start":
+                # Held back until the first body chunk decides on compression
+                start_message = message
+                return
+            if message["type"] != "http.response.body":
+                # e.g. http.response.pathsend, which is never compressed
+                if start_message is not None:
+                    start, start_message = start_message, None
+                    await send(start)
+                await send(message)
+                return
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            if start_message is not None:
+                start, start_message = start_message, None
+                encoder = self._encoder_for(start, body, more_body, coding)
+                if encoder is None:
+                    await send(start)
+                    await send(message)
+                    return
+                encoded = encoder.encode(body, final=not more_body)
+                if not more_body:
+                    MutableHeaders(scope=start)["Content-Length"] = str(len(encoded))
+                await send(start)
+            elif encoder is None:
+                await send(message)
+                return
+            else:
+                encoded = encoder.encode(body, final=not more_body)
+            _stats["bytes_in"] += len(body)
+            _stats["bytes_out"] += len(encoded)
+            if encoded or not more_body:
+                await send({"type": "http.response.body", "body": encoded, "more_body": more_body})
+
+        await self.app(scope, receive, compressing_send)
+
+    def _encoder_for(self, start: dict, body: bytes, more_body: bool, coding: Optional[str]):
+        """Adjust the response headers for the chosen coding; the encoder to use, or None"""
+        headers = MutableHeaders(scope=start)
+        status = start["status"]
+        content_type = headers.get("content-type", "").lower()
+        if (status < 200 or status in (204, 206, 304) or "content-encoding" in headers
+                or not content_type.startswith(COMPRESSIBLE_TYPES)):
+            return None
+        headers.add_vary_header("Accept-Encoding")
+        if coding is None or (not more_body and len(body) < self.minimum_size):
+            return None
+
+        headers["Content-Encoding"] = coding
+        if "content-length" in headers:
+            del headers["content-length"]
+        etag = headers.get("etag")
+        if etag and etag.endswith('"'):
+            headers["ETag"] = f'{etag[:-1]}-{coding}"'
+        _stats["compressed"] += 1
+        return _ENCODERS[coding]()
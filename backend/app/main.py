@@ -1,50 +1,87 @@
-from fastapi import FastAPI, Request
-from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
-from app.routers import auth, users, config
-from app.models.database import engine, Base
 import os
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI, Response
+from starlette.concurrency import run_in_threadpool
+from fastapi.middleware.cors import CORSMiddleware
+from app.routers import auth, users, config, avatars, audit
+from app.routers.config import init_default_configs
+from app.models.database import AsyncSessionLocal, async_engine, async_write_engine, wait_for_database, prewarm_pool
+from app.models import migrations
+from app.models.replicas import ReadYourWritesMiddleware, read_window, replica_pool
+from app.principal_cache import principal_cache, token_cache
+from app.hashing import hashing_pool
+from app.audit_logger import flush_audit_logging, get_audit_metrics
+from app.audit_store import audit_store
+from app.api_keys import APIKeyMiddleware, api_keyring
+from app.avatars import derivative_cache, AVATAR_URL_PREFIX
+from app.rate_limit import login_limiter
+from app.config_store import config_store
+from app.static_files import UploadFiles
+from app.storage import storage, LocalStorage
+from app.coordination import coordinator, RECONNECTED, COORDINATION_HEARTBEAT
+from app.http_cache import CompressionMiddleware, COMPRESSION_MIN_SIZE
+from app import http_cache, metrics, permissions
 
-# Create database tables
-Base.metadata.create_all(bind=engine)
+# Apply pending schema migrations on startup (run `python -m app.models.migrations` instead in production)
+AUTO_MIGRATE = os.getenv("AUTO_MIGRATE", "true").lower() in ("1", "true", "yes")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Nothing touches the database at import time; connect (with retries) here
+    await wait_for_database()
+    if AUTO_MIGRATE:
+        await run_in_threadpool(migrations.upgrade)
+    async with AsyncSessionLocal() as db:
+        await init_default_configs(db)
+        await config_store.get(db)
+    await prewarm_pool()
+    await coordinator.start()
+    replica_pool.start()
+    
+    yield
+    
+    await replica_pool.stop()
+    await coordinator.stop()
+    hashing_pool.shutdown()
+    flush_audit_logging()
+    await async_engine.dispose()
+    await async_write_engine.dispose()
 
 app = FastAPI(
     title="POC Web App API",
     description="Backend API for the React frontend",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan,
 )
 
+# Role permissions can be overridden at runtime through SystemConfig
+config_store.subscribe(permissions.apply_config)
+
+# Other workers (see app/server.py) drop the same cache entries as this one
+principal_cache.on_invalidate(lambda subject: coordinator.publish("principal_cache.invalidate", subject))
+coordinator.subscribe("principal_cache.invalidate", principal_cache.invalidate_local)
+config_store.on_invalidate(lambda: coordinator.publish("config_store.invalidate"))
+coordinator.subscribe("config_store.invalidate", lambda _: config_store.invalidate_local())
+
+
+def _resync(_):
+    # Invalidations sent while disconnected from the hub were lost
+    principal_cache.clear()
+    config_store.invalidate_local()
+
+
+coordinator.subscribe(RECONNECTED, _resync)
+
 # API Key for service-to-service authentication
 # In production, use Azure Key Vault or environment secrets
-API_KEY = os.environ.get("API_KEY", "")
+# Several keys may be active during rotation (see app/api_keys.py)
+app.add_middleware(APIKeyMiddleware, keyring=api_keyring, exempt_prefixes=(f"{AVATAR_URL_PREFIX}/",))
 
-@app.middleware("http")
-async def validate_api_key(request: Request, call_next):
-    """Validate API key for all /api/ routes except health check and OPTIONS"""
-    path = request.url.path
-    
-    # Skip validation for:
-    # - Non-API routes (static files, etc.)
-    # - Health check endpoint (for Azure monitoring)
-    # - OPTIONS requests (CORS preflight)
-    # - When API_KEY is not configured (local development)
-    if (
-        not path.startswith("/api/") or
-        path == "/api/health" or
-        request.method == "OPTIONS" or
-        not API_KEY
-    ):
-        return await call_next(request)
-    
-    # Validate the API key
-    provided_key = request.headers.get("X-API-KEY")
-    if provided_key != API_KEY:
-        return JSONResponse(
-            status_code=401,
-            content={"detail": "Invalid or missing API key"}
-        )
-    
-    return await call_next(request)
+# Clients read from the primary for a few seconds after their own writes
+if replica_pool.enabled:
+    read_window.secret = auth.SECRET_KEY.encode()
+    app.add_middleware(ReadYourWritesMiddleware, window=read_window)
 
 # CORS configuration
 app.add_middleware(
@@ -57,13 +94,64 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "ETag"],
 )
 
+# gzip/brotli for large JSON and NDJSON responses (COMPRESSION_MIN_SIZE=0 disables it)
+if COMPRESSION_MIN_SIZE > 0:
+    app.add_middleware(CompressionMiddleware)
+
+# Outermost, so timings include the API key, CORS and compression middleware
+if metrics.METRICS_ENABLED:
+    app.add_middleware(metrics.MetricsMiddleware)
+    metrics.registry.register_stats("principal_cache", principal_cache.stats, counters=("hits", "misses", "evictions"))
+    metrics.registry.register_stats("token_cache", token_cache.stats, counters=("hits", "misses"))
+    metrics.registry.register_stats("avatar_cache", derivative_cache.stats, counters=("hits", "misses", "evictions"))
+    metrics.registry.register_stats("login_limiter", login_limiter.stats, counters=("throttled", "evictions"))
+    metrics.registry.register_stats("audit", get_audit_metrics, counters=("dropped", "written", "failed", "batches"))
+    if audit_store.enabled:
+        metrics.registry.register_stats("audit_store", audit_store.stats, counters=("appended", "sealed", "compactions", "deleted", "errors"))
+    metrics.registry.register_stats("http_cache", http_cache.stats, counters=("not_modified", "compressed", "bytes_in", "bytes_out"))
+    metrics.registry.register_stats("coordination", coordinator.status, counters=("dropped", "fallbacks", "reconnects"))
+    if replica_pool.enabled:
+        metrics.registry.register_stats("db_replicas", replica_pool.stats, counters=("replica_reads", "primary_reads", "failovers"))
+
 # Include routers
 app.include_router(auth.router, prefix="/api/auth", tags=["Authentication"])
 app.include_router(users.router, prefix="/api/users", tags=["Users"])
 app.include_router(config.router, prefix="/api/config", tags=["Configuration"])
+app.include_router(avatars.router, prefix="/api/avatars", tags=["Avatars"])
+app.include_router(audit.router, prefix="/api/audit", tags=["Audit"])
+
+# Uploaded avatars (the avatar_url of users), served without API key or DB
+if isinstance(storage, LocalStorage):
+    app.mount(storage.url_prefix, UploadFiles(storage), name="uploads")
 
 @app.get("/api/health")
-def health_check():
-    return {"status": "healthy", "message": "API is running"}
+async def health_check():
+    coordination = coordinator.status()
+    workers = await coordinator.workers()
+    for worker in workers:
+        worker["stale"] = worker["age"] > 3 * COORDINATION_HEARTBEAT
+    # Degraded: this worker is serving, but with state not shared with its siblings
+    healthy = coordination["connected"] and not any(worker["stale"] for worker in workers)
+    body = {
+        "status": "healthy" if healthy else "degraded",
+        "message": "API is running",
+        "worker": {"pid": os.getpid(), **coordination},
+        "workers": workers,
+        "principal_cache": principal_cache.stats(),
+        "token_cache": token_cache.stats(),
+        "audit": get_audit_metrics(),
+    }
+    # Reads fall back to the primary, so unhealthy replicas don't degrade the API
+    if replica_pool.enabled:
+        body["replicas"] = replica_pool.stats()
+    return body
+
+
+# Prometheus scrape endpoint; outside /api/ so the API key middleware skips it
+if metrics.METRICS_ENABLED:
+    @app.get("/metrics", include_in_schema=False)
+    async def prometheus_metrics():
+        return Response(metrics.registry.render(), media_type=metrics.CONTENT_TYPE)
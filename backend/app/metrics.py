@@ -0,0 +1,285 @@
+"""
+Request-path instrumentation and a Prometheus text endpoint
+Latency histograms per route, DB query count/time per request, pool
+checkout wait (labelled by pool) and size, threadpool usage and queue
+wait, bcrypt and audit enqueue timing.
+
+Everything is kept in process (no client library); /metrics renders the
+Prometheus text format. With METRICS_ENABLED=false the middleware is not
+installed, the engine is not instrumented and the hooks in hashing and
+audit logging are skipped, so the request path pays nothing.
+"""
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterable, Optional, Sequence, Tuple
+
+from sqlalchemy import event
+from starlette.concurrency import run_in_threadpool as starlette_run_in_threadpool
+
+# Collect metrics and serve /metrics
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() in ("1", "true", "yes")
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 50, 100)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{%s}" % ",".join(parts) if parts else ""
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Histogram:
+    """Fixed-bucket histogram keyed by label values"""
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        # label values -> [per-bucket counts..., +Inf count], sum
+        self._series: Dict[Tuple[str, ...], list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labelvalues: str):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labelvalues)
+            if series is None:
+                series = self._series[labelvalues] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def collect(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} histogram"
+        with self._lock:
+            series = [(labels, list(counts), total) for labels, (counts, total) in self._series.items()]
+        for labelvalues, counts, total in sorted(series):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = 'le="%s"' % _number(float(bound))
+                yield f"{self.name}_bucket{_labels(self.labelnames, labelvalues, le)} {cumulative}"
+            yield f"{self.name}_sum{_labels(self.labelnames, labelvalues)} {_number(total)}"
+            yield f"{self.name}_count{_labels(self.labelnames, labelvalues)} {cumulative}"
+
+
+class Gauge:
+    """Value read from a callback at scrape time"""
+
+    def __init__(self, name: str, help: str, read: Callable[[], Optional[float]], kind: str = "gauge"):
+        self.name = name
+        self.help = help
+        self.read = read
+        self.kind = kind
+
+    def collect(self) -> Iterable[str]:
+        value = self.read()
+        if value is None:
+            return
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} {self.kind}"
+        yield f"{self.name} {_number(value)}"
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, help, labelnames, buckets))
+
+    def gauge(self, name: str, help: str, read: Callable[[], Optional[float]], kind: str = "gauge") -> Gauge:
+        return self.register(Gauge(name, help, read, kind))
+
+    def register_stats(self, prefix: str, stats: Callable[[], dict], counters: Sequence[str] = ()):
+        """Expose each numeric key of an existing stats() dict; keys in counters become *_total counters"""
+        for key, value in stats().items():
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                continue
+            if key in counters:
+                self.gauge(f"{prefix}_{key}_total", f"{prefix} {key}", lambda key=key: stats().get(key), kind="counter")
+            else:
+                self.gauge(f"{prefix}_{key}", f"{prefix} {key}", lambda key=key: stats().get(key))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.collect())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+REQUEST_DURATION = registry.histogram(
+    "http_request_duration_seconds", "Request latency by route", ("method", "route", "status"))
+REQUEST_DB_QUERIES = registry.histogram(
+    "http_request_db_queries", "Database queries issued per request", ("route",), COUNT_BUCKETS)
+REQUEST_DB_TIME = registry.histogram(
+    "http_request_db_seconds", "Time spent in database queries per request", ("route",))
+DB_QUERY_DURATION = registry.histogram(
+    "db_query_duration_seconds", "Latency of individual database queries")
+DB_POOL_CHECKOUT_WAIT = registry.histogram(
+    "db_pool_checkout_wait_seconds", "Time waiting for a pooled connection", ("pool",))
+THREADPOOL_QUEUE_WAIT = registry.histogram(
+    "threadpool_queue_wait_seconds", "Time the app's run_in_threadpool calls wait for a worker thread")
+
+
+class RequestStats:
+    __slots__ = ("queries", "query_time")
+
+    def __init__(self):
+        self.queries = 0
+        self.query_time = 0.0
+
+
+# Stats of the request being handled; the DB hooks add to it
+_request_stats: ContextVar[Optional[RequestStats]] = ContextVar("request_stats", default=None)
+
+_in_flight = 0
+
+
+class MetricsMiddleware:
+    """Time every HTTP request and record its DB usage, labelled by route template"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        global _in_flight
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        stats = RequestStats()
+        token = _request_stats.set(stats)
+        _in_flight += 1
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - started
+            _in_flight -= 1
+            _request_stats.reset(token)
+            # The router stores the matched route in the scope; unmatched paths share one label
+            route = scope.get("route")
+            route_label = getattr(route, "path", "unmatched")
+            REQUEST_DURATION.observe(elapsed, scope["method"], route_label, str(status_code))
+            REQUEST_DB_QUERIES.observe(stats.queries, route_label)
+            REQUEST_DB_TIME.observe(stats.query_time, route_label)
+
+
+registry.gauge("http_requests_in_flight", "Requests currently being handled", lambda: _in_flight)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    context._metrics_started = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - context._metrics_started
+    DB_QUERY_DURATION.observe(elapsed)
+    stats = _request_stats.get()
+    if stats is not None:
+        stats.queries += 1
+        stats.query_time += elapsed
+
+
+def _pool_stat(pool, name: str) -> Optional[float]:
+    # QueuePool reports size/checkedout/overflow; NullPool and StaticPool don't
+    fn = getattr(pool, name, None)
+    return fn() if callable(fn) else None
+
+
+def timed_pool(poolclass, label: str = "main"):
+    """
+    poolclass for create_engine(): with metrics on, a subclass whose
+    connect() (every checkout, including pre-ping or opening a connection)
+    records its wait as pool=label. Pool events only fire once a connection
+    has been handed out, so they can't time the wait itself.
+    """
+    if not METRICS_ENABLED:
+        return poolclass
+
+    def connect(self):
+        started = time.perf_counter()
+        try:
+            return poolclass.connect(self)
+        finally:
+            DB_POOL_CHECKOUT_WAIT.observe(time.perf_counter() - started, label)
+
+    # A class rather than a per-instance hook: dispose() recreates the pool from its class
+    return type(f"Timed{poolclass.__name__}", (poolclass,), {"connect": connect})
+
+
+def instrument_engine(engine, pool_prefix: str = "db_pool"):
+    """Count and time queries on an (async) engine, and export its pool's size as pool_prefix_*"""
+    if not METRICS_ENABLED:
+        return
+    sync_engine = getattr(engine, "sync_engine", engine)
+    event.listen(sync_engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(sync_engine, "after_cursor_execute", _after_cursor_execute)
+
+    pool = sync_engine.pool
+    registry.gauge(f"{pool_prefix}_size", "Connections the pool keeps open", lambda: _pool_stat(pool, "size"))
+    registry.gauge(f"{pool_prefix}_checked_out", "Connections currently checked out", lambda: _pool_stat(pool, "checkedout"))
+    registry.gauge(f"{pool_prefix}_overflow", "Connections opened beyond the pool size", lambda: _pool_stat(pool, "overflow"))
+
+
+def _threadpool_stat(name: str) -> Optional[float]:
+    # anyio's default limiter bounds the threadpool Starlette runs sync endpoints in
+    from anyio import to_thread
+    try:
+        limiter = to_thread.current_default_thread_limiter()
+    except RuntimeError:
+        return None
+    if name == "waiting":
+        return limiter.statistics().tasks_waiting
+    return getattr(limiter, name)
+
+
+async def run_in_threadpool(func, *args, **kwargs):
+    """starlette's run_in_threadpool, recording how long the call waits for a thread"""
+    if not METRICS_ENABLED:
+        return await starlette_run_in_threadpool(func, *args, **kwargs)
+    submitted = time.perf_counter()
+
+    def timed_func():
+        THREADPOOL_QUEUE_WAIT.observe(time.perf_counter() - submitted)
+        return func(*args, **kwargs)
+
+    return await starlette_run_in_threadpool(timed_func)
+
+
+registry.gauge("threadpool_tokens_total", "Threads available to sync endpoints", lambda: _threadpool_stat("total_tokens"))
+registry.gauge("threadpool_tokens_in_use", "Threads busy with sync endpoints", lambda: _threadpool_stat("borrowed_tokens"))
+registry.gauge("threadpool_tasks_waiting", "Sync calls queued for a thread", lambda: _threadpool_stat("waiting"))
@@ -1,3 +1,3 @@
 # Models package
-from app.models.database import Base, engine, get_db
-from app.models.user import User, SystemConfig, UserRole
+from app.models.database import Base, engine, async_engine, get_db
+from app.models.user import User, SystemConfig, SetupFlag, UserRole
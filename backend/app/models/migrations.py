@@ -0,0 +1,169 @@
+"""
+Schema migrations
+Ordered, idempotent steps recorded in a schema_migrations table. Run them
+as an explicit deploy step:
+
+    python -m app.models.migrations            # upgrade to the latest version
+    python -m app.models.migrations current    # print the applied version
+
+With AUTO_MIGRATE=true (default) the API also applies pending steps on
+startup, which is convenient locally; production should run the command
+once per release and start workers with AUTO_MIGRATE=false.
+
+Step 1 creates any missing tables from the current models, so a fresh
+database is complete after it and later steps must check before altering
+(they exist to bring databases created by older releases up to date).
+"""
+import logging
+import sys
+from typing import Callable, List, Tuple
+
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, inspect, insert, select, text
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.sql import func
+
+from app.models.database import Base, engine
+from app.models.user import ADMIN_BOOTSTRAP_FLAG, SetupFlag, User
+
+logger = logging.getLogger(__name__)
+
+schema_migrations = Table(
+    "schema_migrations",
+    MetaData(),
+    Column("version", Integer, primary_key=True),
+    Column("name", String(100), nullable=False),
+    Column("applied_at", DateTime(timezone=True), server_default=func.now()),
+)
+
+
+def _create_tables(conn: Connection):
+    Base.metadata.create_all(bind=conn)
+
+
+def _add_users_token_version(conn: Connection):
+    columns = {column["name"] for column in inspect(conn).get_columns("users")}
+    if "token_version" not in columns:
+        conn.execute(text("ALTER TABLE users ADD COLUMN token_version INTEGER NOT NULL DEFAULT 0"))
+
+
+def _index_names(conn: Connection, table_name: str) -> set:
+    if conn.dialect.name == "sqlite":
+        # The SQLite inspector skips expression indexes such as ix_users_email_lower
+        return set(conn.scalars(
+            text("SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = :table"), {"table": table_name}
+        ))
+    return {index["name"] for index in inspect(conn).get_indexes(table_name)}
+
+
+def _create_missing_indexes(table: Table, skip=()):
+    def step(conn: Connection):
+        existing = _index_names(conn, table.name)
+        for index in table.indexes:
+            if index.name not in existing and index.name not in skip:
+                # Dialect-specific indexes (ddl_if) are skipped elsewhere
+                index.create(bind=conn)
+    return step
+
+
+def _add_users_email_lower(conn: Connection):
+    # The unique index can't be built while two accounts differ only in casing
+    lowered = func.lower(User.email)
+    duplicates = conn.scalar(
+        select(func.count()).select_from(
+            select(lowered).group_by(lowered).having(func.count() > 1).subquery()
+        )
+    )
+    if duplicates:
+        raise RuntimeError(
+            f"{duplicates} email(s) are registered more than once with different casing; "
+            "merge or rename those accounts, then rerun the migration"
+        )
+    _create_missing_indexes(User.__table__)(conn)
+
+
+def _create_setup_flags(conn: Connection):
+    SetupFlag.__table__.create(bind=conn, checkfirst=True)
+    # A database that already has users has had its first admin
+    has_users = conn.scalar(select(User.id).limit(1)) is not None
+    flagged = conn.scalar(select(SetupFlag.name).where(SetupFlag.name == ADMIN_BOOTSTRAP_FLAG)) is not None
+    if has_users and not flagged:
+        conn.execute(insert(SetupFlag).values(name=ADMIN_BOOTSTRAP_FLAG))
+
+
+def _add_row_versions(conn: Connection):
+    for table_name in ("users", "system_config"):
+        columns = {column["name"] for column in inspect(conn).get_columns(table_name)}
+        if "row_version" not in columns:
+            conn.execute(text(f"ALTER TABLE {table_name} ADD COLUMN row_version INTEGER NOT NULL DEFAULT 0"))
+
+
+def _widen_system_config_value(conn: Connection):
+    # SQLite doesn't enforce VARCHAR lengths (nor can it change a column's type)
+    if conn.dialect.name == "sqlite":
+        return
+    if conn.dialect.name == "mysql":
+        conn.execute(text("ALTER TABLE system_config MODIFY value TEXT NULL"))
+    else:
+        conn.execute(text("ALTER TABLE system_config ALTER COLUMN value TYPE TEXT"))
+
+
+MIGRATIONS: Tuple[Tuple[int, str, Callable[[Connection], None]], ...] = (
+    (1, "create tables", _create_tables),
+    (2, "users.token_version", _add_users_token_version),
+    (3, "users filter and prefix indexes", _create_missing_indexes(User.__table__, skip=("ix_users_email_lower",))),
+    (4, "users case-insensitive email index", _add_users_email_lower),
+    (5, "setup_flags with the admin bootstrap flag", _create_setup_flags),
+    (6, "users and system_config row_version", _add_row_versions),
+    (7, "system_config.value as text", _widen_system_config_value),
+)
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def applied_versions(bind: Engine) -> set:
+    with bind.begin() as conn:
+        schema_migrations.create(bind=conn, checkfirst=True)
+        return set(conn.scalars(select(schema_migrations.c.version)))
+
+
+def current_version(bind: Engine = engine) -> int:
+    return max(applied_versions(bind), default=0)
+
+
+def upgrade(bind: Engine = engine) -> List[int]:
+    """
+    Apply pending migrations, each in its own transaction.
+
+    Safe to run from several processes at once: a step another process
+    finished first is skipped. Returns the versions applied here.
+    """
+    applied = applied_versions(bind)
+    newly_applied = []
+    for version, name, step in MIGRATIONS:
+        if version in applied:
+            continue
+        try:
+            with bind.begin() as conn:
+                step(conn)
+                conn.execute(insert(schema_migrations).values(version=version, name=name))
+        except DBAPIError:
+            # Another process may have applied it concurrently
+            if version in applied_versions(bind):
+                continue
+            raise
+        logger.info("Applied migration %s: %s", version, name)
+        newly_applied.append(version)
+    return newly_applied
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    command = sys.argv[1] if len(sys.argv) > 1 else "upgrade"
+    if command == "current":
+        print(current_version())
+    elif command == "upgrade":
+        upgrade()
+        print(f"Schema at version {current_version()} (latest {LATEST_VERSION})")
+    else:
+        sys.exit(f"Unknown command: {command} (expected upgrade or current)")
@@ -0,0 +1,263 @@
+"""
+Read replica routing
+Read-only handlers take their session from get_read_db, which picks a
+healthy replica from DATABASE_REPLICA_URLS round-robin. A client that made
+a successful write in the last REPLICA_STICKY_SECONDS reads from the
+primary instead, so it sees its own writes despite replication lag; the
+window travels with the client in a signed cookie.
+
+Replicas are health-checked every REPLICA_CHECK_INTERVAL seconds and also
+marked down when a connect fails; reads fall back to the primary while no
+replica is healthy.
+
+Authentication and the config snapshot stay on the primary: a lagging
+replica must not accept a revoked token or republish an old config.
+"""
+import asyncio
+import hashlib
+import hmac
+import itertools
+import logging
+import math
+import os
+import time
+from typing import Optional
+
+from fastapi import Depends, Request
+from sqlalchemy import text
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from starlette.datastructures import Headers, MutableHeaders
+
+from app import metrics
+from app.models.database import AsyncSessionLocal, get_db, pool_options, to_async_url
+
+logger = logging.getLogger(__name__)
+
+# Comma-separated read replica URLs, same format as DATABASE_URL (empty: no routing)
+DATABASE_REPLICA_URLS = [url.strip() for url in os.getenv("DATABASE_REPLICA_URLS", "").split(",") if url.strip()]
+# Seconds a client keeps reading from the primary after its own write
+REPLICA_STICKY_SECONDS = float(os.getenv("REPLICA_STICKY_SECONDS", "5"))
+# Seconds between replica health checks, and how long one check may take
+REPLICA_CHECK_INTERVAL = float(os.getenv("REPLICA_CHECK_INTERVAL", "5"))
+REPLICA_CHECK_TIMEOUT = float(os.getenv("REPLICA_CHECK_TIMEOUT", "2"))
+# Replicas further behind than this many seconds are skipped (PostgreSQL only)
+REPLICA_MAX_LAG = float(os.getenv("REPLICA_MAX_LAG", "10"))
+
+SAFE_METHODS = {"GET", "HEAD", "OPTIONS"}
+# Carries the end of the client's primary-read window (see ReadWindow)
+READ_WINDOW_COOKIE = "read_primary_until"
+
+# Replay lag in seconds; 0 when everything received has been replayed, since an
+# idle primary would otherwise look like a growing lag
+POSTGRES_LAG_QUERY = text(
+    "SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+    "ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END"
+)
+
+
+class Replica:
+    def __init__(self, index: int, url: str):
+        self.name = f"replica{index}"
+        if url.startswith("sqlite"):
+            self.engine = create_async_engine(to_async_url(url))
+        else:
+            self.engine = create_async_engine(
+                to_async_url(url), poolclass=metrics.timed_pool(AsyncAdaptedQueuePool, self.name),
+                pool_pre_ping=True, pool_recycle=3600, **pool_options,
+            )
+        metrics.instrument_engine(self.engine, pool_prefix=f"db_{self.name}_pool")
+        self.healthy = True
+        self.lag: Optional[float] = None
+        self.error: Optional[str] = None
+
+    def stats(self) -> dict:
+        return {"name": self.name, "healthy": self.healthy, "lag": self.lag, "error": self.error}
+
+
+class ReplicaPool:
+    """Round-robin over healthy replicas, with the primary as the fallback"""
+
+    def __init__(self, urls):
+        self.replicas = [Replica(index, url) for index, url in enumerate(urls)]
+        self.replica_reads = 0
+        self.primary_reads = 0
+        self.failovers = 0
+        self._turn = itertools.count()
+        self._monitor: Optional[asyncio.Task] = None
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.replicas)
+
+    def choose(self) -> Optional[Replica]:
+        healthy = [replica for replica in self.replicas if replica.healthy]
+        if not healthy:
+            return None
+        return healthy[next(self._turn) % len(healthy)]
+
+    def mark_down(self, replica: Replica, error):
+        if replica.healthy:
+            logger.warning("Read replica %s marked down: %s", replica.name, error)
+        replica.healthy = False
+        replica.error = str(error)
+
+    async def replica_session(self) -> Optional[AsyncSession]:
+        """Session on a healthy replica, or None when reads should go to the primary"""
+        replica = self.choose()
+        if replica is None:
+            return None
+        db = AsyncSessionLocal(bind=replica.engine)
+        try:
+            # Connect now, so a dead replica fails over before the handler runs
+            await db.connection()
+        except (DBAPIError, OSError) as e:
+            await db.close()
+            self.mark_down(replica, e)
+            self.failovers += 1
+            return None
+        self.replica_reads += 1
+        return db
+
+    async def session(self, sticky: bool = False) -> AsyncSession:
+        """Session for read-only work: a healthy replica unless sticky, otherwise the primary"""
+        db = None if sticky else await self.replica_session()
+        if db is None:
+            self.primary_reads += 1
+            return AsyncSessionLocal()
+        return db
+
+    async def check(self, replica: Replica):
+        try:
+            async with replica.engine.connect() as conn:
+                if conn.dialect.name == "postgresql":
+                    lag = await asyncio.wait_for(conn.scalar(POSTGRES_LAG_QUERY), REPLICA_CHECK_TIMEOUT)
+                    replica.lag = float(lag) if lag is not None else None
+                else:
+                    await asyncio.wait_for(conn.execute(text("SELECT 1")), REPLICA_CHECK_TIMEOUT)
+        except (DBAPIError, OSError, asyncio.TimeoutError) as e:
+            self.mark_down(replica, str(e) or "health check timed out")
+            return
+        if replica.lag is not None and replica.lag > REPLICA_MAX_LAG:
+            self.mark_down(replica, f"replication lag {replica.lag:.1f}s")
+            return
+        if not replica.healthy:
+            logger.info("Read replica %s is healthy again", replica.name)
+        replica.healthy = True
+        replica.error = None
+
+    async def _monitor_loop(self):
+        while True:
+            await asyncio.gather(*(self.check(replica) for replica in self.replicas))
+            await asyncio.sleep(REPLICA_CHECK_INTERVAL)
+
+    def start(self):
+        if self.enabled and self._monitor is None:
+            self._monitor = asyncio.create_task(self._monitor_loop())
+
+    async def stop(self):
+        if self._monitor is not None:
+            self._monitor.cancel()
+            await asyncio.gather(self._monitor, return_exceptions=True)
+            self._monitor = None
+        for replica in self.replicas:
+            await replica.engine.dispose()
+
+    def stats(self) -> dict:
+        return {
+            "replica_reads": self.replica_reads,
+            "primary_reads": self.primary_reads,
+            "failovers": self.failovers,
+            "healthy": sum(replica.healthy for replica in self.replicas),
+            "replicas": [replica.stats() for replica in self.replicas],
+        }
+
+
+class ReadWindow:
+    """
+    A client's primary-read window, kept by the client in a cookie so that
+    any worker or instance can honour it. The cookie holds the window's end,
+    signed together with client_key(), so it can't be forged or carried over
+    to another token.
+    """
+
+    def __init__(self, seconds: float, secret: bytes = b""):
+        self.seconds = seconds
+        self.secret = secret
+
+    def _signature(self, key: str, until: int) -> str:
+        return hmac.new(self.secret, f"{key}:{until}".encode(), hashlib.sha256).hexdigest()[:32]
+
+    def issue(self, key: str) -> str:
+        """Cookie value opening the window for key from now"""
+        until = int(time.time() + self.seconds) + 1
+        return f"{until}.{self._signature(key, until)}"
+
+    def is_open(self, key: Optional[str], value: Optional[str]) -> bool:
+        if key is None or not value:
+            return False
+        until, _, signature = value.partition(".")
+        if not until.isdigit() or int(until) <= time.time():
+            return False
+        return hmac.compare_digest(signature, self._signature(key, int(until)))
+
+
+def client_key(authorization: Optional[str]) -> Optional[str]:
+    """Identify a client by its bearer token (hashed); None for anonymous requests"""
+    if not authorization:
+        return None
+    return hashlib.sha256(authorization.encode()).hexdigest()[:32]
+
+
+replica_pool = ReplicaPool(DATABASE_REPLICA_URLS)
+# app/main.py sets the secret
+read_window = ReadWindow(REPLICA_STICKY_SECONDS)
+
+
+class ReadYourWritesMiddleware:
+    """Pure ASGI middleware: a successful write sets the client's primary-read window cookie"""
+
+    def __init__(self, app, window: ReadWindow = read_window):
+        self.app = app
+        self.window = window
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] in SAFE_METHODS:
+            await self.app(scope, receive, send)
+            return
+        key = client_key(Headers(scope=scope).get("authorization"))
+        if key is None:
+            await self.app(scope, receive, send)
+            return
+
+        async def send_wrapper(message):
+            # The handler has committed by the time the response starts
+            if message["type"] == "http.response.start" and message["status"] < 400:
+                MutableHeaders(scope=message).append("Set-Cookie", (
+                    f"{READ_WINDOW_COOKIE}={self.window.issue(key)}; Max-Age={math.ceil(self.window.seconds)}; "
+                    "Path=/api; HttpOnly; SameSite=Lax"
+                ))
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
+
+
+def reads_from_primary(request: Request) -> bool:
+    """Whether this client wrote recently enough that replicas may not have its write"""
+    return read_window.is_open(client_key(request.headers.get("authorization")), request.cookies.get(READ_WINDOW_COOKIE))
+
+
+async def get_read_db(request: Request, primary: AsyncSession = Depends(get_db)):
+    """
+    get_db for read-only handlers: a replica session unless the client wrote
+    recently. Primary reads share the request's get_db session, so a request
+    never holds two primary connections (which can exhaust the pool).
+    """
+    db = None if reads_from_primary(request) else await replica_pool.replica_session()
+    if db is None:
+        replica_pool.primary_reads += 1
+        yield primary
+        return
+    async with db:
+        yield db
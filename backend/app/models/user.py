@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, Enum
+from sqlalchemy import Column, Integer, String, Text, Boolean, DateTime, Enum, Index, literal_column
 from sqlalchemy.sql import func
 from app.models.database import Base
 import enum
@@ -10,6 +10,14 @@ class UserRole(str, enum.Enum):
     USER = "user"
     VIEWER = "viewer"
 
+def row_version_column():
+    """
+    Counter bumped by every UPDATE of the row (ORM or Core), so clients can
+    tell versions apart where updated_at's resolution can't (see app/http_cache.py)
+    """
+    return Column(Integer, nullable=False, default=0, server_default="0",
+                  onupdate=literal_column("row_version") + 1)
+
 class User(Base):
     __tablename__ = "users"
     
@@ -31,14 +39,46 @@ class User(Base):
     # System fields
     role = Column(String(20), default=UserRole.USER.value)
     is_active = Column(Boolean, default=True)
+    # Bumped to revoke every token issued before (role change, deactivation)
+    token_version = Column(Integer, nullable=False, default=0, server_default="0")
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+    row_version = row_version_column()
+    
+    __table_args__ = (
+        # Keyset pagination with equality filters: WHERE <col> = ? AND id > ? ORDER BY id
+        Index("ix_users_role_id", "role", "id"),
+        Index("ix_users_department_id", "department", "id"),
+        Index("ix_users_country_id", "country", "id"),
+        Index("ix_users_is_active_id", "is_active", "id"),
+        # Prefix search (LIKE 'abc%') on PostgreSQL needs pattern ops
+        Index("ix_users_email_prefix", "email", postgresql_ops={"email": "varchar_pattern_ops"}).ddl_if(dialect="postgresql"),
+        Index("ix_users_full_name_prefix", "full_name", postgresql_ops={"full_name": "varchar_pattern_ops"}).ddl_if(dialect="postgresql"),
+        # Emails are unique regardless of casing, and looked up through email_matches()
+        Index("ix_users_email_lower", func.lower(email), unique=True),
+    )
+
+def email_matches(email: str):
+    """WHERE clause for the user with this email in any casing (served by ix_users_email_lower)"""
+    return func.lower(User.email) == email.lower()
 
 class SystemConfig(Base):
     __tablename__ = "system_config"
     
     id = Column(Integer, primary_key=True, index=True)
     key = Column(String(100), unique=True, nullable=False)
-    value = Column(String(500), nullable=True)
+    # Text: a role_permissions override is a JSON document of every role's permissions
+    value = Column(Text, nullable=True)
     description = Column(String(255), nullable=True)
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+    row_version = row_version_column()
+
+# SetupFlag name claimed by the first registration, which becomes admin
+ADMIN_BOOTSTRAP_FLAG = "admin_bootstrapped"
+
+class SetupFlag(Base):
+    """One-time setup events; inserting the row claims the event, so only one request wins"""
+    __tablename__ = "setup_flags"
+    
+    name = Column(String(100), primary_key=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
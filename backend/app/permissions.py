@@ -1,9 +1,21 @@
 """
 Role-Based Access Control (RBAC) Permissions
 Defines what each role can and cannot do
+
+Role permissions are compiled to integer bitmasks, so a permission check
+is a single AND. The built-in ROLE_PERMISSIONS can be overridden at runtime
+through the "role_permissions" SystemConfig key (see load_role_permissions).
 """
+import hashlib
+import json
+import logging
 from enum import Enum
-from typing import List
+from typing import Dict, Iterable, List, Mapping, Optional
+
+logger = logging.getLogger(__name__)
+
+# SystemConfig key holding runtime role overrides: {"role": ["permission", ...]}
+ROLE_PERMISSIONS_CONFIG_KEY = "role_permissions"
 
 class Permission(str, Enum):
     # Config permissions
@@ -18,6 +30,9 @@ class Permission(str, Enum):
     # Profile permissions
     VIEW_OWN_PROFILE = "view_own_profile"
     EDIT_OWN_PROFILE = "edit_own_profile"
+    
+    # Audit permissions
+    VIEW_AUDIT = "view_audit"
 
 # Role permission mapping
 ROLE_PERMISSIONS = {
@@ -29,6 +44,7 @@ ROLE_PERMISSIONS = {
         Permission.CHANGE_ROLES,
         Permission.VIEW_OWN_PROFILE,
         Permission.EDIT_OWN_PROFILE,
+        Permission.VIEW_AUDIT,
     ],
     "manager": [
         Permission.VIEW_CONFIG,
@@ -52,14 +68,99 @@ ROLE_PERMISSIONS = {
     ],
 }
 
+# One bit per permission, in declaration order
+PERMISSION_BITS = {permission: 1 << index for index, permission in enumerate(Permission)}
+
+def permission_mask(permissions: Iterable[Permission]) -> int:
+    """Combine permissions into a bitmask"""
+    mask = 0
+    for permission in permissions:
+        mask |= PERMISSION_BITS[Permission(permission)]
+    return mask
+
+def compile_role_permissions(role_permissions: Mapping[str, Iterable[Permission]]) -> Dict[str, int]:
+    """Compile a role -> permissions mapping to role -> bitmask"""
+    return {role: permission_mask(perms) for role, perms in role_permissions.items()}
+
+def _policy_version(role_masks: Mapping[str, int]) -> str:
+    # Derived from the content so every replica computes the same version
+    body = json.dumps(sorted(role_masks.items()))
+    return hashlib.sha256(body.encode()).hexdigest()[:12]
+
+# Active policy; replaced as a whole by load_role_permissions
+ROLE_MASKS: Dict[str, int] = compile_role_permissions(ROLE_PERMISSIONS)
+POLICY_VERSION = _policy_version(ROLE_MASKS)
+
+def parse_role_permissions(value: str) -> Dict[str, List[Permission]]:
+    """
+    Parse a role_permissions config value.
+    
+    Raises:
+        ValueError: if the value is not a JSON object of role -> list of known permissions
+    """
+    try:
+        data = json.loads(value)
+    except (TypeError, json.JSONDecodeError) as e:
+        raise ValueError(f"role_permissions must be JSON: {e}")
+    if not isinstance(data, dict):
+        raise ValueError("role_permissions must be a JSON object of role -> permissions")
+    parsed = {}
+    for role, perms in data.items():
+        if not isinstance(perms, list):
+            raise ValueError(f"Permissions for role '{role}' must be a list")
+        try:
+            parsed[role] = [Permission(p) for p in perms]
+        except ValueError as e:
+            raise ValueError(f"Unknown permission for role '{role}': {e}")
+    return parsed
+
+def load_role_permissions(overrides: Optional[Mapping[str, Iterable[Permission]]]):
+    """Activate ROLE_PERMISSIONS plus runtime overrides (roles listed in overrides replace the defaults)"""
+    global ROLE_MASKS, POLICY_VERSION
+    role_permissions = dict(ROLE_PERMISSIONS)
+    role_permissions.update(overrides or {})
+    role_masks = compile_role_permissions(role_permissions)
+    ROLE_MASKS, POLICY_VERSION = role_masks, _policy_version(role_masks)
+
+def apply_config(configs: Mapping[str, object]):
+    """Load role overrides from a SystemConfig key -> item mapping; invalid values are ignored"""
+    item = configs.get(ROLE_PERMISSIONS_CONFIG_KEY)
+    overrides = None
+    if item is not None:
+        try:
+            overrides = parse_role_permissions(item.value)
+        except ValueError as e:
+            logger.warning("Ignoring invalid %s config: %s", ROLE_PERMISSIONS_CONFIG_KEY, e)
+    load_role_permissions(overrides)
+
+def is_known_role(role: str) -> bool:
+    return role in ROLE_MASKS
+
+def role_mask(role: str) -> int:
+    """Permission bitmask of a role under the active policy"""
+    return ROLE_MASKS.get(role, 0)
+
+def claims_mask(claims: Mapping[str, object], role: str) -> int:
+    """
+    Permission bitmask for a request.
+    
+    Uses the mask embedded in the token when it was issued for the same
+    role under the active policy version, otherwise recomputes it.
+    """
+    perms = claims.get("perms")
+    if isinstance(perms, int) and claims.get("role") == role and claims.get("pv") == POLICY_VERSION:
+        return perms
+    return role_mask(role)
+
 def has_permission(role: str, permission: Permission) -> bool:
     """Check if a role has a specific permission"""
-    role_perms = ROLE_PERMISSIONS.get(role, [])
-    return permission in role_perms
+    bit = PERMISSION_BITS[permission]
+    return ROLE_MASKS.get(role, 0) & bit == bit
 
 def get_permissions(role: str) -> List[Permission]:
     """Get all permissions for a role"""
-    return ROLE_PERMISSIONS.get(role, [])
+    mask = ROLE_MASKS.get(role, 0)
+    return [permission for permission, bit in PERMISSION_BITS.items() if mask & bit]
 
 def can_access_config(role: str) -> bool:
     """Check if role can access config page"""
@@ -0,0 +1,186 @@
+"""
+Verified-principal cache
+Keeps a short-lived, in-process copy of the authenticated user so that
+get_current_user does not hit the users table on every request, and the
+claims of recently verified tokens so repeat requests skip JWT verification.
+"""
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from types import MappingProxyType
+
+from app.models.user import User
+
+# Seconds a cached principal stays valid (0 disables the cache)
+PRINCIPAL_CACHE_TTL = float(os.getenv("PRINCIPAL_CACHE_TTL", "30"))
+# Maximum number of cached principals (least recently used are evicted)
+PRINCIPAL_CACHE_SIZE = int(os.getenv("PRINCIPAL_CACHE_SIZE", "1024"))
+# Maximum number of verified bearer tokens remembered (0 disables)
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", "4096"))
+
+_USER_COLUMNS = tuple(column.key for column in User.__table__.columns)
+
+
+class UserSnapshot:
+    """Detached, read-only copy of a User row"""
+    __slots__ = _USER_COLUMNS
+
+    def __init__(self, user: User):
+        for name in _USER_COLUMNS:
+            object.__setattr__(self, name, getattr(user, name))
+
+    def __setattr__(self, name, value):
+        raise AttributeError("UserSnapshot is read-only")
+
+    def __delattr__(self, name):
+        raise AttributeError("UserSnapshot is read-only")
+
+    def __repr__(self):
+        return f"<UserSnapshot id={self.id} email={self.email!r}>"
+
+
+class PrincipalCache:
+    """Thread-safe TTL + LRU cache of UserSnapshot keyed by (subject, token hash)"""
+
+    def __init__(self, ttl: float, maxsize: int):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        # subject -> keys of its entries, so invalidate() doesn't scan the cache
+        self._keys_by_subject = {}
+        self._lock = threading.Lock()
+        self._invalidation_listeners = []
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl > 0 and self.maxsize > 0
+
+    def on_invalidate(self, listener):
+        """Call listener(subject) after every invalidate(), e.g. to tell other workers"""
+        self._invalidation_listeners.append(listener)
+
+    @staticmethod
+    def _key(subject: str, token: str):
+        return subject, hashlib.sha256(token.encode()).digest()
+
+    def _forget(self, key):
+        """Unindex a key already removed from _entries (caller holds the lock)"""
+        keys = self._keys_by_subject.get(key[0])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._keys_by_subject[key[0]]
+
+    def get(self, subject: str, token: str):
+        if not self.enabled:
+            return None
+        key = self._key(subject, token)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] <= now:
+                if entry is not None:
+                    del self._entries[key]
+                    self._forget(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, subject: str, token: str, user: User) -> UserSnapshot:
+        snapshot = UserSnapshot(user)
+        if not self.enabled:
+            return snapshot
+        key = self._key(subject, token)
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, snapshot)
+            self._entries.move_to_end(key)
+            self._keys_by_subject.setdefault(subject, set()).add(key)
+            while len(self._entries) > self.maxsize:
+                evicted, _ = self._entries.popitem(last=False)
+                self._forget(evicted)
+                self.evictions += 1
+        return snapshot
+
+    def invalidate(self, subject: str):
+        """Drop every cached entry for a subject (all of the user's tokens)"""
+        self.invalidate_local(subject)
+        for listener in self._invalidation_listeners:
+            listener(subject)
+
+    def invalidate_local(self, subject: str):
+        """invalidate() without notifying listeners (for invalidations received from elsewhere)"""
+        with self._lock:
+            for key in self._keys_by_subject.pop(subject, ()):
+                self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._keys_by_subject.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+principal_cache = PrincipalCache(PRINCIPAL_CACHE_TTL, PRINCIPAL_CACHE_SIZE)
+
+
+class VerifiedTokenCache:
+    """LRU of bearer token -> verified claims, honouring each token's exp"""
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, token: str):
+        if self.maxsize <= 0:
+            return None
+        with self._lock:
+            claims = self._entries.get(token)
+            if claims is None or claims.get("exp", 0) <= time.time():
+                if claims is not None:
+                    del self._entries[token]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(token)
+            self.hits += 1
+            return claims
+
+    def put(self, token: str, claims: dict):
+        """Remember verified claims; returns them as a read-only mapping"""
+        claims = MappingProxyType(dict(claims))
+        if self.maxsize <= 0:
+            return claims
+        with self._lock:
+            self._entries[token] = claims
+            self._entries.move_to_end(token)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return claims
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"size": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+token_cache = VerifiedTokenCache(TOKEN_CACHE_SIZE)
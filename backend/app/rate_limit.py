@@ -0,0 +1,175 @@
+"""
+Login throttling
+Sliding-window counters keyed by email and by client IP, checked before
+any database or bcrypt work so credential stuffing cannot exhaust CPU.
+
+Backends:
+    memory        - per-process LRU with TTL eviction (default)
+    coordinated   - counters kept by the coordination hub, shared by the
+                    workers of a multi-process server (app/coordination.py)
+    module:Class  - any RateLimiter subclass, e.g. one backed by a shared
+                    store when several replicas must share counters
+"""
+import importlib
+import math
+import os
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Optional
+
+# Login attempts allowed per email and per client IP within the sliding window
+LOGIN_ATTEMPTS_PER_EMAIL = int(os.getenv("LOGIN_ATTEMPTS_PER_EMAIL", "10"))
+LOGIN_ATTEMPTS_PER_IP = int(os.getenv("LOGIN_ATTEMPTS_PER_IP", "100"))
+LOGIN_WINDOW_SECONDS = float(os.getenv("LOGIN_WINDOW_SECONDS", "300"))
+# Which limiter backend to use: memory | coordinated | module:Class
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "memory")
+# Keys tracked by the memory backend before the least recently used are evicted
+RATE_LIMIT_MAX_KEYS = int(os.getenv("RATE_LIMIT_MAX_KEYS", "100000"))
+# Take the client IP from X-Forwarded-For (only behind a proxy that sets it)
+TRUST_FORWARDED_FOR = os.getenv("TRUST_FORWARDED_FOR", "false").lower() in ("1", "true", "yes")
+
+
+class RateLimiter(ABC):
+    """Interface for limiter backends"""
+
+    @abstractmethod
+    async def hit(self, key: str, limit: int, window: float) -> Optional[float]:
+        """
+        Count one attempt for key.
+
+        Returns:
+            None if the attempt is allowed, otherwise the seconds until it
+            would be; rejected attempts are not counted.
+        """
+
+    @abstractmethod
+    async def reset(self, key: str):
+        """Forget all attempts for key"""
+
+    def stats(self) -> dict:
+        return {}
+
+
+class MemoryRateLimiter(RateLimiter):
+    """
+    Sliding-window counter per key: the current and previous fixed window
+    counts, with the previous one weighted by how much of it still overlaps
+    the sliding window. Three numbers per key; keys idle for two windows
+    expire, and at most max_keys are kept (least recently used go first).
+
+    Only used from the event loop, so no locking.
+    """
+
+    def __init__(self, max_keys: int):
+        self.max_keys = max_keys
+        self.throttled = 0
+        self.evictions = 0
+        # key -> [window index, previous window count, current window count]
+        self._entries: "OrderedDict[str, list]" = OrderedDict()
+
+    def _expire(self, now: float, window: float):
+        # Oldest entries sit at the front; stop at the first one still live
+        while self._entries:
+            entry = next(iter(self._entries.values()))
+            if entry[0] < int(now // window) - 1:
+                self._entries.popitem(last=False)
+            else:
+                break
+
+    async def hit(self, key: str, limit: int, window: float) -> Optional[float]:
+        now = time.time()
+        index = int(now // window)
+        entry = self._entries.get(key)
+        if entry is None:
+            self._expire(now, window)
+            if len(self._entries) >= self.max_keys:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+            entry = self._entries[key] = [index, 0, 0]
+        else:
+            self._entries.move_to_end(key)
+            if entry[0] != index:
+                entry[1] = entry[2] if entry[0] == index - 1 else 0
+                entry[2] = 0
+                entry[0] = index
+
+        elapsed = now - index * window
+        previous, current = entry[1], entry[2]
+        weight = 1 - elapsed / window
+        if previous * weight + current < limit:
+            entry[2] += 1
+            return None
+
+        self.throttled += 1
+        if current >= limit or previous == 0:
+            # Blocked until this window ends, then by its own count
+            return math.ceil(window - elapsed) or 1
+        # Wait until the previous window's share has decayed below the remaining allowance
+        wait = window * (1 - (limit - current) / previous) - elapsed
+        return max(1, math.ceil(wait))
+
+    async def reset(self, key: str):
+        self._entries.pop(key, None)
+
+    def stats(self) -> dict:
+        return {"keys": len(self._entries), "throttled": self.throttled, "evictions": self.evictions}
+
+
+class CoordinatedRateLimiter(RateLimiter):
+    """Delegates to a Coordinator, which falls back to local counters when its hub is down"""
+
+    def __init__(self, coordinator):
+        self.coordinator = coordinator
+        self.throttled = 0
+
+    async def hit(self, key: str, limit: int, window: float) -> Optional[float]:
+        retry_after = await self.coordinator.hit(key, limit, window)
+        if retry_after is not None:
+            self.throttled += 1
+        return retry_after
+
+    async def reset(self, key: str):
+        await self.coordinator.reset(key)
+
+    def stats(self) -> dict:
+        return {"throttled": self.throttled}
+
+
+def create_rate_limiter(backend: str = RATE_LIMIT_BACKEND) -> RateLimiter:
+    if ":" in backend:
+        module_name, class_name = backend.split(":", 1)
+        return getattr(importlib.import_module(module_name), class_name)()
+    if backend == "coordinated":
+        from app.coordination import coordinator
+        return CoordinatedRateLimiter(coordinator)
+    return MemoryRateLimiter(RATE_LIMIT_MAX_KEYS)
+
+
+login_limiter = create_rate_limiter()
+
+
+def client_ip(request) -> str:
+    """Client address of a request, honouring X-Forwarded-For only when configured to"""
+    if TRUST_FORWARDED_FOR:
+        forwarded = request.headers.get("x-forwarded-for")
+        if forwarded:
+            return forwarded.split(",", 1)[0].strip()
+    return request.client.host if request.client else "unknown"
+
+
+async def check_login_allowed(email: str, ip: str) -> Optional[float]:
+    """
+    Count a login attempt against the email and the IP.
+
+    Returns None if it may proceed, otherwise seconds to wait.
+    """
+    retry_after = await login_limiter.hit(f"ip:{ip}", LOGIN_ATTEMPTS_PER_IP, LOGIN_WINDOW_SECONDS)
+    if retry_after is None:
+        retry_after = await login_limiter.hit(f"email:{email.lower()}", LOGIN_ATTEMPTS_PER_EMAIL, LOGIN_WINDOW_SECONDS)
+    return retry_after
+
+
+async def login_succeeded(email: str):
+    """Clear the email's counter so earlier typos don't count against the user"""
+    await login_limiter.reset(f"email:{email.lower()}")
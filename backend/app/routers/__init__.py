@@ -1 +1 @@
-from app.routers import auth, users, config
+from app.routers import auth, users, config, avatars, audit
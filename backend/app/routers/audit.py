@@ -0,0 +1,67 @@
+from datetime import datetime, timezone
+from typing import Iterator, Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import StreamingResponse
+
+from app.audit_logger import log_admin_action
+from app.audit_store import audit_store
+from app.models.user import User
+from app.permissions import Permission
+from app.routers.auth import require
+from app.serialization import NDJSON_MEDIA_TYPE
+
+router = APIRouter()
+
+# Bytes of JSON lines sent per chunk of the streamed response
+AUDIT_CHUNK_BYTES = 64 * 1024
+
+def _timestamp(value: Optional[datetime]) -> Optional[float]:
+    if value is None:
+        return None
+    # Audit timestamps are UTC; read naive times the same way
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.timestamp()
+
+def _chunks(lines: Iterator[bytes]) -> Iterator[bytes]:
+    buffer = bytearray()
+    for line in lines:
+        buffer += line
+        buffer += b"\n"
+        if len(buffer) >= AUDIT_CHUNK_BYTES:
+            yield bytes(buffer)
+            buffer.clear()
+    if buffer:
+        yield bytes(buffer)
+
+@router.get("/")
+async def query_audit(
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    admin_user: Optional[str] = None,
+    action: Optional[str] = None,
+    target_user: Optional[str] = None,
+    limit: int = Query(1000, ge=1, le=100000),
+    current_user: User = Depends(require(Permission.VIEW_AUDIT, detail="Admin access required"))
+):
+    """
+    Stream audit events from the local store as NDJSON, oldest first.
+    Filters match Admin_User, Action and Target_User exactly.
+    """
+    if not audit_store.enabled:
+        raise HTTPException(status_code=404, detail="The local audit store is not enabled (AUDIT_STORE_DIR)")
+
+    log_admin_action(
+        admin_user=current_user.email,
+        action="QUERY_AUDIT",
+        details={"since": since and since.isoformat(), "until": until and until.isoformat(),
+                 "admin_user": admin_user, "action": action, "target_user": target_user},
+    )
+
+    lines = audit_store.query(
+        _timestamp(since), _timestamp(until), limit,
+        admin_user=admin_user, action=action, target_user=target_user,
+    )
+    # A sync iterator: Starlette reads the memory-mapped segments in its threadpool
+    return StreamingResponse(_chunks(lines), media_type=NDJSON_MEDIA_TYPE)
@@ -1,15 +1,21 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Request, status
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
 from datetime import datetime, timedelta
-from jose import JWTError, jwt
-from passlib.context import CryptContext
 import os
 
-from app.models.database import get_db
-from app.models.user import User, UserRole
+from app.models.database import get_db, insert_ignore, insert_returning
+from app.models.user import ADMIN_BOOTSTRAP_FLAG, SetupFlag, User, UserRole, email_matches
 from app.schemas import UserCreate, UserResponse, Token, LoginRequest
 from app.audit_logger import log_auth_event
+from app.principal_cache import principal_cache, token_cache
+from app.hashing import verify_password_async, hash_password_async
+from app.config_store import config_store
+from app.rate_limit import client_ip, check_login_allowed, login_succeeded
+from app.permissions import Permission, permission_mask, role_mask, claims_mask
+import app.permissions as permissions
 
 router = APIRouter()
 
@@ -18,66 +24,163 @@ SECRET_KEY = os.getenv("SECRET_KEY", "your-secret-key-change-in-production")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 24  # 24 hours
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/auth/token")
 
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    # Truncate to 72 bytes (bcrypt limit)
-    return pwd_context.verify(plain_password[:72], hashed_password)
-
-def get_password_hash(password: str) -> str:
-    # Truncate to 72 bytes (bcrypt limit)
-    return pwd_context.hash(password[:72])
-
 def create_access_token(data: dict, expires_delta: timedelta = None):
     to_encode = data.copy()
     expire = datetime.utcnow() + (expires_delta or timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES))
     to_encode.update({"exp": expire})
+    # Imported lazily (with its crypto backends) to keep worker startup fast
+    from jose import jwt
     return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
 
-async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
-    credentials_exception = HTTPException(
+def principal_claims(user: User) -> dict:
+    """JWT claims identifying a user and their permissions under the active policy"""
+    return {
+        "sub": user.email,
+        "uid": user.id,
+        "role": user.role,
+        "perms": role_mask(user.role),
+        "pv": permissions.POLICY_VERSION,
+        "tv": user.token_version or 0,
+    }
+
+def credentials_exception() -> HTTPException:
+    return HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
+
+async def get_token_claims(token: str = Depends(oauth2_scheme)) -> dict:
+    """Verified JWT claims; tokens seen recently skip signature verification"""
+    claims = token_cache.get(token)
+    if claims is not None:
+        return claims
+    from jose import JWTError, jwt
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        email: str = payload.get("sub")
-        if email is None:
-            raise credentials_exception
     except JWTError:
-        raise credentials_exception
+        raise credentials_exception()
+    if payload.get("sub") is None:
+        raise credentials_exception()
+    return token_cache.put(token, payload)
+
+def is_token_current(claims: dict, user: User) -> bool:
+    """Whether a token was issued for the user's current token version and the user is active"""
+    return user.is_active is not False and claims.get("tv", 0) == (user.token_version or 0)
+
+async def get_current_user(
+    token: str = Depends(oauth2_scheme),
+    claims: dict = Depends(get_token_claims),
+    db: AsyncSession = Depends(get_db)
+):
+    email: str = claims["sub"]
     
-    user = db.query(User).filter(User.email == email).first()
+    # Serve the principal from the in-process cache when possible
+    user = principal_cache.get(email, token)
     if user is None:
-        raise credentials_exception
+        uid = claims.get("uid")
+        if uid is not None:
+            user = await db.get(User, uid)
+        else:
+            user = await db.scalar(select(User).where(email_matches(email)))
+        if user is None or user.email != email:
+            raise credentials_exception()
+        user = principal_cache.put(email, token, user)
+    
+    if not is_token_current(claims, user):
+        raise credentials_exception()
+    return user
+
+def require(*required: Permission, detail: str = "You don't have permission to perform this action"):
+    """
+    Dependency that authorizes the request with a single mask AND and
+    returns the current user.
+    
+    Usage:
+        current_user: User = Depends(require(Permission.VIEW_USERS))
+    """
+    needed = permission_mask(required)
+    
+    async def check_permissions(
+        claims: dict = Depends(get_token_claims),
+        current_user: User = Depends(get_current_user),
+        db: AsyncSession = Depends(get_db)
+    ):
+        # Refreshes the role policy when SystemConfig changed (at most every few seconds)
+        await config_store.get(db)
+        if claims_mask(claims, current_user.role) & needed != needed:
+            raise HTTPException(status_code=403, detail=detail)
+        return current_user
+    
+    return check_permissions
+
+async def throttle_login(request: Request, email: str):
+    """Reject the attempt with 429 before any DB or bcrypt work if email or IP is over its limit"""
+    ip = client_ip(request)
+    retry_after = await check_login_allowed(email, ip)
+    if retry_after is not None:
+        log_auth_event(email, "LOGIN_THROTTLED", False, ip)
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Too many login attempts, please try again later",
+            headers={"Retry-After": str(int(retry_after))},
+        )
+
+async def authenticate_user(db: AsyncSession, email: str, password: str):
+    """Return the user for valid credentials, upgrading outdated hashes in place"""
+    user = await db.scalar(select(User).where(email_matches(email)))
+    if not user:
+        return None
+    valid, new_hash = await verify_password_async(password, user.hashed_password)
+    if not valid:
+        return None
+    if new_hash:
+        user.hashed_password = new_hash
+        await db.commit()
     return user
 
+# Set once this process has seen the bootstrap flag taken, so later
+# registrations skip the claim
+_admin_bootstrapped = False
+
+async def claim_first_admin(db: AsyncSession) -> bool:
+    """
+    Claim the one-time bootstrap flag in the caller's transaction; True for
+    the first registration. Rolling back (e.g. a duplicate email) releases it.
+    """
+    global _admin_bootstrapped
+    if _admin_bootstrapped:
+        return False
+    claimed = await insert_ignore(db, SetupFlag, {"name": ADMIN_BOOTSTRAP_FLAG})
+    if not claimed:
+        _admin_bootstrapped = True
+    return claimed
+
 @router.post("/register", response_model=UserResponse)
-def register(user_data: UserCreate, db: Session = Depends(get_db)):
-    # Check if user exists
-    existing_user = db.query(User).filter(User.email == user_data.email).first()
-    if existing_user:
+async def register(user_data: UserCreate, db: AsyncSession = Depends(get_db)):
+    # Cheap index lookup first, so repeated signups with a taken email don't cost a bcrypt hash each
+    if await db.scalar(select(User.id).where(email_matches(user_data.email))) is not None:
         raise HTTPException(status_code=400, detail="Email already registered")
-    
-    # Create user
-    hashed_password = get_password_hash(user_data.password)
+    hashed_password = await hash_password_async(user_data.password)
     
     # First user becomes admin
-    user_count = db.query(User).count()
-    role = UserRole.ADMIN.value if user_count == 0 else UserRole.USER.value
+    role = UserRole.ADMIN.value if await claim_first_admin(db) else UserRole.USER.value
     
-    db_user = User(
-        email=user_data.email,
-        hashed_password=hashed_password,
-        full_name=user_data.full_name,
-        phone=user_data.phone,
-        role=role
-    )
-    db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
+    # The unique email index still rejects duplicates (in any casing) from concurrent signups
+    try:
+        db_user = await insert_returning(db, User, {
+            "email": user_data.email,
+            "hashed_password": hashed_password,
+            "full_name": user_data.full_name,
+            "phone": user_data.phone,
+            "role": role,
+        })
+        await db.commit()
+    except IntegrityError:
+        await db.rollback()
+        raise HTTPException(status_code=400, detail="Email already registered")
     
     # Audit log
     log_auth_event(user_data.email, "USER_REGISTER", True)
@@ -85,15 +188,17 @@ def register(user_data: UserCreate, db: Session = Depends(get_db)):
     return db_user
 
 @router.post("/login", response_model=Token)
-def login(login_data: LoginRequest, db: Session = Depends(get_db)):
-    user = db.query(User).filter(User.email == login_data.email).first()
-    if not user or not verify_password(login_data.password, user.hashed_password):
+async def login(login_data: LoginRequest, request: Request, db: AsyncSession = Depends(get_db)):
+    await throttle_login(request, login_data.email)
+    user = await authenticate_user(db, login_data.email, login_data.password)
+    if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect email or password",
         )
+    await login_succeeded(user.email)
     
-    access_token = create_access_token(data={"sub": user.email})
+    access_token = create_access_token(data=principal_claims(user))
     
     # Audit log
     log_auth_event(user.email, "USER_LOGIN", True)
@@ -101,13 +206,15 @@ def login(login_data: LoginRequest, db: Session = Depends(get_db)):
     return {"access_token": access_token, "token_type": "bearer"}
 
 @router.post("/token", response_model=Token)
-def login_for_token(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
-    user = db.query(User).filter(User.email == form_data.username).first()
-    if not user or not verify_password(form_data.password, user.hashed_password):
+async def login_for_token(request: Request, form_data: OAuth2PasswordRequestForm = Depends(), db: AsyncSession = Depends(get_db)):
+    await throttle_login(request, form_data.username)
+    user = await authenticate_user(db, form_data.username, form_data.password)
+    if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect email or password",
         )
+    await login_succeeded(user.email)
     
-    access_token = create_access_token(data={"sub": user.email})
+    access_token = create_access_token(data=principal_claims(user))
     return {"access_token": access_token, "token_type": "bearer"}
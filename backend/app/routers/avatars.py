@@ -0,0 +1,20 @@
+from fastapi import APIRouter, HTTPException
+
+from app.avatars import get_variant, VARIANT_EXT, VARIANT_MEDIA_TYPE
+from app.static_files import ContentAddressedFileResponse
+from app.storage import storage
+
+router = APIRouter()
+
+@router.get("/{name}/{variant}")
+async def get_avatar_variant(name: str, variant: str):
+    """Resized avatar; content-addressed, so it can be cached forever"""
+    size, _, ext = variant.partition(".")
+    if ext != VARIANT_EXT or not size.isdigit():
+        raise HTTPException(status_code=404, detail="Avatar variant not found")
+    
+    cached = await get_variant(storage, name, int(size))
+    if cached is None:
+        raise HTTPException(status_code=404, detail="Avatar variant not found")
+    path, stat_result = cached
+    return ContentAddressedFileResponse(path, stat_result, f'"{name}-{variant}"', VARIANT_MEDIA_TYPE)
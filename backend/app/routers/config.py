@@ -1,13 +1,18 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Request
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List
 
-from app.models.database import get_db
-from app.models.user import User, UserRole, SystemConfig
+from app.models.database import get_db, insert_returning, update_returning
+from app.models.user import User, SystemConfig
 from app.schemas import ConfigItem, ConfigResponse
-from app.routers.auth import get_current_user
+from app.routers.auth import get_current_user, require
 from app.audit_logger import log_config_change
-from app.permissions import can_access_config, can_edit_config
+from app.permissions import Permission, ROLE_PERMISSIONS_CONFIG_KEY, parse_role_permissions
+from app.config_store import config_store
+from app.http_cache import CACHE_CONTROL, etag_matches, not_modified
+from app.serialization import JSONBytesResponse, config_adapter
 
 router = APIRouter()
 
@@ -19,62 +24,82 @@ DEFAULT_CONFIGS = [
     {"key": "max_upload_size", "value": "5242880", "description": "Max file upload size in bytes"},
 ]
 
-def init_default_configs(db: Session):
-    """Initialize default configurations if not exist"""
-    for config in DEFAULT_CONFIGS:
-        existing = db.query(SystemConfig).filter(SystemConfig.key == config["key"]).first()
-        if not existing:
-            db_config = SystemConfig(**config)
-            db.add(db_config)
-    db.commit()
+def validate_config_value(key: str, value: str):
+    """Reject values the application could not apply"""
+    if key == ROLE_PERMISSIONS_CONFIG_KEY:
+        try:
+            parse_role_permissions(value)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+async def init_default_configs(db: AsyncSession):
+    """Initialize default configurations if not exist (run once at startup)"""
+    existing = set((await db.scalars(
+        select(SystemConfig.key).where(SystemConfig.key.in_([c["key"] for c in DEFAULT_CONFIGS]))
+    )).all())
+    missing = [SystemConfig(**config) for config in DEFAULT_CONFIGS if config["key"] not in existing]
+    if not missing:
+        return
+    db.add_all(missing)
+    try:
+        await db.commit()
+    except IntegrityError:
+        # Another replica seeded the defaults concurrently
+        await db.rollback()
+    config_store.invalidate()
 
 @router.get("/", response_model=List[ConfigResponse])
-def get_all_configs(
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+async def get_all_configs(
+    request: Request,
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(require(Permission.VIEW_CONFIG, detail="You don't have permission to view configuration"))
 ):
-    if not can_access_config(current_user.role):
-        raise HTTPException(status_code=403, detail="You don't have permission to view configuration")
-    
-    init_default_configs(db)
-    configs = db.query(SystemConfig).all()
-    return configs
+    snapshot = await config_store.get(db)
+    if etag_matches(request, snapshot.etag):
+        return not_modified(snapshot.etag)
+    # Pre-encoded with the snapshot; bypasses response_model re-validation
+    return JSONBytesResponse(snapshot.body, headers={"ETag": snapshot.etag, "Cache-Control": CACHE_CONTROL})
 
 @router.get("/{key}", response_model=ConfigResponse)
-def get_config(
+async def get_config(
     key: str,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
-    config = db.query(SystemConfig).filter(SystemConfig.key == key).first()
+    snapshot = await config_store.get(db)
+    config = snapshot.by_key.get(key)
     if not config:
         raise HTTPException(status_code=404, detail="Configuration not found")
-    return config
+    return JSONBytesResponse(config_adapter.dump_json(config))
 
 @router.put("/{key}", response_model=ConfigResponse)
-def update_config(
+async def update_config(
     key: str,
     config_data: ConfigItem,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(require(Permission.EDIT_CONFIG, detail="You don't have permission to edit configuration"))
 ):
-    if not can_edit_config(current_user.role):
-        raise HTTPException(status_code=403, detail="You don't have permission to edit configuration")
+    validate_config_value(key, config_data.value)
     
-    config = db.query(SystemConfig).filter(SystemConfig.key == key).first()
+    config = await db.scalar(select(SystemConfig).where(SystemConfig.key == key))
     old_value = config.value if config else None
     
     if not config:
         # Create new config
-        config = SystemConfig(key=key, value=config_data.value, description=config_data.description)
-        db.add(config)
+        config = await insert_returning(db, SystemConfig, {
+            "key": key, "value": config_data.value, "description": config_data.description,
+        })
     else:
-        config.value = config_data.value
+        changes = {"value": config_data.value}
         if config_data.description:
-            config.description = config_data.description
+            changes["description"] = config_data.description
+        changes = {field: value for field, value in changes.items() if getattr(config, field) != value}
+        if not changes:
+            return config
+        config = await update_returning(db, SystemConfig, [SystemConfig.id == config.id], changes)
     
-    db.commit()
-    db.refresh(config)
+    await db.commit()
+    config_store.invalidate()
     
     # Audit log
     log_config_change(current_user.email, key, old_value or "(new)", config_data.value)
@@ -82,20 +107,18 @@ def update_config(
     return config
 
 @router.post("/", response_model=ConfigResponse)
-def create_config(
+async def create_config(
     config_data: ConfigItem,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(require(Permission.EDIT_CONFIG, detail="Admin access required"))
 ):
-    if current_user.role != UserRole.ADMIN.value:
-        raise HTTPException(status_code=403, detail="Admin access required")
+    validate_config_value(config_data.key, config_data.value)
     
-    existing = db.query(SystemConfig).filter(SystemConfig.key == config_data.key).first()
+    existing = await db.scalar(select(SystemConfig).where(SystemConfig.key == config_data.key))
     if existing:
         raise HTTPException(status_code=400, detail="Configuration key already exists")
     
-    config = SystemConfig(**config_data.model_dump())
-    db.add(config)
-    db.commit()
-    db.refresh(config)
+    config = await insert_returning(db, SystemConfig, config_data.model_dump())
+    await db.commit()
+    config_store.invalidate()
     return config
@@ -1,127 +1,293 @@
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File
-from sqlalchemy.orm import Session
-from typing import List
-import os
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Query, Request, Response
+from fastapi.responses import StreamingResponse
+from fastapi.routing import APIRoute
+from sqlalchemy import select, update, insert, or_, func
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from pydantic import ValidationError
+from typing import Optional
+from datetime import datetime
+from itertools import islice
+from anyio import from_thread
+import csv
+import io
+import json
 
-from app.models.database import get_db
+from app.metrics import run_in_threadpool
+from app.models.database import get_db, AsyncSessionLocal, update_returning
+from app.models.replicas import get_read_db, reads_from_primary, replica_pool
 from app.models.user import User, UserRole
-from app.schemas import UserResponse, UserUpdate, UserRoleUpdate
-from app.routers.auth import get_current_user
+from app.schemas import (
+    UserCreate, UserResponse, UserUpdate, UserRoleUpdate,
+    BulkRoleUpdate, BulkRoleUpdateResult, UserImportError, UserImportResult,
+)
+from app.routers.auth import get_current_user, require
 from app.audit_logger import log_admin_action
-from app.permissions import can_edit_own_profile, can_view_users, can_change_roles
+from app.permissions import Permission, is_known_role, has_permission
+from app.principal_cache import principal_cache
+from app.config_store import config_store
+from app.routers.config import DEFAULT_CONFIGS
+from app.storage import storage, iter_upload, safe_suffix, UploadTooLarge
+from app.avatars import avatar_variants
+from app.hashing import hash_passwords_async
+from app.http_cache import CACHE_CONTROL, etag_matches, make_etag, not_modified
+from app.serialization import JSONBytesResponse, NDJSON_MEDIA_TYPE, json_array_chunks, ndjson, wants_ndjson
 
 router = APIRouter()
 
+# Page size limits for list_users
+USER_PAGE_SIZE_DEFAULT = 100
+USER_PAGE_SIZE_MAX = 500
+
+# Columns a client may request through list_users(fields=...)
+USER_LIST_FIELDS = tuple(UserResponse.model_fields)
+
+# Ids per UPDATE ... WHERE id IN (...) in bulk role changes
+USER_BULK_CHUNK_SIZE = 1000
+# Rows validated, hashed and inserted per transaction during imports
+USER_IMPORT_BATCH_SIZE = 100
+# Row errors reported back from an import (the rest are only counted)
+USER_IMPORT_MAX_ERRORS = 100
+# Rows fetched per round trip while exporting
+USER_EXPORT_BATCH_SIZE = 1000
+# Columns accepted from import files besides email/password
+USER_IMPORT_FIELDS = tuple(f for f in UserCreate.model_fields if f != "password")
+
+# Allowance for multipart boundaries and part headers on top of the file itself
+MULTIPART_OVERHEAD = 16 * 1024
+DEFAULT_MAX_UPLOAD_SIZE = int(next(c["value"] for c in DEFAULT_CONFIGS if c["key"] == "max_upload_size"))
+
+async def get_max_upload_size(db: AsyncSession) -> int:
+    """max_upload_size from SystemConfig, falling back to the default"""
+    snapshot = await config_store.get(db)
+    config = snapshot.by_key.get("max_upload_size")
+    try:
+        return int(config.value)
+    except (AttributeError, TypeError, ValueError):
+        return DEFAULT_MAX_UPLOAD_SIZE
+
+def upload_too_large(max_size: int) -> HTTPException:
+    return HTTPException(status_code=413, detail=f"File exceeds the maximum upload size of {max_size} bytes")
+
+class UploadLimitRoute(APIRoute):
+    """
+    Route that aborts the request while the body is still being received
+    once it grows past max_upload_size, before multipart parsing spools it.
+    
+    The session opened for the lookup becomes the request's session (get_db
+    returns request.state.db), and the limit is left in
+    request.state.max_upload_size for the endpoint.
+    """
+    def get_route_handler(self):
+        handler = super().get_route_handler()
+        
+        async def limited_handler(request: Request):
+            async with AsyncSessionLocal() as db:
+                request.state.db = db
+                request.state.max_upload_size = await get_max_upload_size(db)
+                return await self._handle(handler, request, request.state.max_upload_size)
+        
+        return limited_handler
+    
+    @staticmethod
+    async def _handle(handler, request: Request, max_size: int):
+        limit = max_size + MULTIPART_OVERHEAD
+        
+        content_length = request.headers.get("content-length", "")
+        if content_length.isdigit() and int(content_length) > limit:
+            raise upload_too_large(max_size)
+        
+        received = 0
+        receive = request.receive
+        
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    raise upload_too_large(max_size)
+            return message
+        
+        return await handler(Request(request.scope, limited_receive))
+
 @router.get("/me", response_model=UserResponse)
-def get_current_user_info(current_user: User = Depends(get_current_user)):
+async def get_current_user_info(request: Request, response: Response, current_user: User = Depends(get_current_user)):
+    # Every UPDATE bumps row_version, so the version identifies the representation
+    etag = make_etag("me", USER_LIST_FIELDS, current_user.id, current_user.row_version)
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = CACHE_CONTROL
     return current_user
 
 @router.put("/me", response_model=UserResponse)
-def update_current_user(
+async def update_current_user(
     user_data: UserUpdate,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(require(Permission.EDIT_OWN_PROFILE, detail="Your role does not allow profile editing"))
 ):
-    # Check if user can edit their own profile
-    if not can_edit_own_profile(current_user.role):
-        raise HTTPException(status_code=403, detail="Your role does not allow profile editing")
-    
-    # Update all profile fields
-    fields_updated = []
-    
-    if user_data.full_name is not None:
-        current_user.full_name = user_data.full_name
-        fields_updated.append("full_name")
-    if user_data.phone is not None:
-        current_user.phone = user_data.phone
-        fields_updated.append("phone")
-    if user_data.address is not None:
-        current_user.address = user_data.address
-        fields_updated.append("address")
-    if user_data.city is not None:
-        current_user.city = user_data.city
-        fields_updated.append("city")
-    if user_data.country is not None:
-        current_user.country = user_data.country
-        fields_updated.append("country")
-    if user_data.department is not None:
-        current_user.department = user_data.department
-        fields_updated.append("department")
-    if user_data.job_title is not None:
-        current_user.job_title = user_data.job_title
-        fields_updated.append("job_title")
-    if user_data.date_of_birth is not None:
-        current_user.date_of_birth = user_data.date_of_birth
-        fields_updated.append("date_of_birth")
-    
-    db.commit()
-    db.refresh(current_user)
+    # The UPDATE only applies if a sent field differs from the stored row.
+    # current_user is the principal snapshot, which can lag a write made
+    # through another instance, so it is not compared against.
+    changes = user_data.model_dump(exclude_none=True)
+    user = None
+    if changes:
+        user = await update_returning(
+            db, User, [User.id == current_user.id], changes,
+            only_if=or_(*(getattr(User, field).is_distinct_from(value) for field, value in changes.items())),
+        )
+    if not user:
+        # Nothing to change: answer with the stored profile
+        user = await db.scalar(select(User).where(User.id == current_user.id).execution_options(populate_existing=True))
+        if not user:
+            raise HTTPException(status_code=404, detail="User not found")
+        return user
+    await db.commit()
+    principal_cache.invalidate(user.email)
     
     # Audit log for profile update
-    if fields_updated:
-        log_admin_action(
-            admin_user=current_user.email,
-            action="UPDATE_PROFILE",
-            target_user=current_user.email,
-            details={"fields_updated": fields_updated}
-        )
+    log_admin_action(
+        admin_user=user.email,
+        action="UPDATE_PROFILE",
+        target_user=user.email,
+        details={"fields_updated": list(changes)}
+    )
     
-    return current_user
+    return user
 
-@router.post("/avatar", response_model=UserResponse)
 async def upload_avatar(
+    request: Request,
     file: UploadFile = File(...),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
-    # For POC: save locally. In production: Azure Blob Storage
-    upload_dir = "uploads/avatars"
-    os.makedirs(upload_dir, exist_ok=True)
-    
-    filename = f"{current_user.id}_{file.filename}"
-    filepath = os.path.join(upload_dir, filename)
-    
-    with open(filepath, "wb") as f:
-        content = await file.read()
-        f.write(content)
+    # Stream into the configured storage backend, keyed by content hash
+    max_size = request.state.max_upload_size
+    try:
+        key = await storage.save(iter_upload(file), "avatars", safe_suffix(file.filename), max_size)
+    except UploadTooLarge:
+        raise upload_too_large(max_size)
     
-    current_user.avatar_url = f"/uploads/avatars/{filename}"
-    db.commit()
-    db.refresh(current_user)
-    return current_user
+    user = await update_returning(db, User, [User.id == current_user.id], {"avatar_url": storage.url_for(key)})
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+    await db.commit()
+    principal_cache.invalidate(user.email)
+    return user
 
-@router.get("/", response_model=List[UserResponse])
-def list_users(
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+router.add_api_route(
+    "/avatar",
+    upload_avatar,
+    methods=["POST"],
+    response_model=UserResponse,
+    route_class_override=UploadLimitRoute,
+)
+
+def filter_users(stmt, role: Optional[str] = None, department: Optional[str] = None,
+                 country: Optional[str] = None, is_active: Optional[bool] = None):
+    """Add equality filters on the indexed user columns to a select/update"""
+    if role is not None:
+        stmt = stmt.where(User.role == role)
+    if department is not None:
+        stmt = stmt.where(User.department == department)
+    if country is not None:
+        stmt = stmt.where(User.country == country)
+    if is_active is not None:
+        stmt = stmt.where(User.is_active == is_active)
+    return stmt
+
+@router.get("/")
+async def list_users(
+    request: Request,
+    cursor: Optional[int] = Query(None, description="Return users with id greater than this (X-Next-Cursor of the previous page)"),
+    limit: int = Query(USER_PAGE_SIZE_DEFAULT, ge=1, description=f"Page size (capped at {USER_PAGE_SIZE_MAX})"),
+    role: Optional[str] = None,
+    department: Optional[str] = None,
+    country: Optional[str] = None,
+    is_active: Optional[bool] = None,
+    q: Optional[str] = Query(None, description="Email or full name prefix"),
+    fields: Optional[str] = Query(None, description="Comma-separated list of fields to return"),
+    db: AsyncSession = Depends(get_read_db),
+    current_user: User = Depends(require(Permission.VIEW_USERS, detail="You don't have permission to view users"))
 ):
-    if not can_view_users(current_user.role):
-        raise HTTPException(status_code=403, detail="You don't have permission to view users")
+    """
+    List users ordered by id, one keyset-paginated page at a time.
+    
+    The cursor for the next page is returned in the X-Next-Cursor header
+    (absent on the last page). Send Accept: application/x-ndjson to get one
+    JSON object per line instead of an array.
+    """
+    if fields:
+        selected = [f.strip() for f in fields.split(",") if f.strip()]
+        unknown = [f for f in selected if f not in USER_LIST_FIELDS]
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}")
+    else:
+        selected = list(USER_LIST_FIELDS)
+    limit = min(limit, USER_PAGE_SIZE_MAX)
+    
+    # id is always selected (last if not requested) because it drives the cursor;
+    # row_version (always last) only feeds the ETag
+    columns = [getattr(User, f) for f in selected] + ([User.id] if "id" not in selected else []) + [User.row_version]
+    stmt = select(*columns).order_by(User.id).limit(limit + 1)
+    if cursor is not None:
+        stmt = stmt.where(User.id > cursor)
+    stmt = filter_users(stmt, role, department, country, is_active)
+    if q:
+        stmt = stmt.where(or_(
+            User.email.startswith(q, autoescape=True),
+            User.full_name.startswith(q, autoescape=True),
+        ))
+    
+    rows = (await db.execute(stmt)).all()
+    headers = {}
+    if len(rows) > limit:
+        rows = rows[:limit]
+        headers["X-Next-Cursor"] = str(rows[-1].id)
     
-    users = db.query(User).all()
-    return users
+    # The page is identified by its rows' versions; decided before encoding anything
+    as_ndjson = wants_ndjson(request.headers.get("accept"))
+    versions = b",".join(b"%d:%d" % (row.id, row.row_version) for row in rows)
+    etag = make_etag("users", selected, as_ndjson, headers.get("X-Next-Cursor"), versions)
+    headers.update({"ETag": etag, "Cache-Control": CACHE_CONTROL, "Vary": "Accept"})
+    if etag_matches(request, etag):
+        return not_modified(etag, headers)
+    
+    # Encode the column tuples directly: no ORM objects, no response_model pass
+    items = [dict(zip(selected, row)) for row in rows]
+    if "avatar_url" in selected:
+        for item in items:
+            item["avatar_variants"] = avatar_variants(item["avatar_url"])
+    if as_ndjson:
+        return Response(ndjson(items), media_type=NDJSON_MEDIA_TYPE, headers=headers)
+    return JSONBytesResponse(items, headers=headers)
 
 @router.put("/{user_id}/role", response_model=UserResponse)
-def update_user_role(
+async def update_user_role(
     user_id: int,
     role_data: UserRoleUpdate,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(require(Permission.CHANGE_ROLES, detail="You don't have permission to change roles"))
 ):
-    if not can_change_roles(current_user.role):
-        raise HTTPException(status_code=403, detail="You don't have permission to change roles")
-    
-    user = db.query(User).filter(User.id == user_id).first()
+    user = await db.get(User, user_id)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     
-    if role_data.role not in [r.value for r in UserRole]:
+    if not is_known_role(role_data.role):
         raise HTTPException(status_code=400, detail="Invalid role")
     
     old_role = user.role
-    user.role = role_data.role
-    db.commit()
-    db.refresh(user)
+    if old_role == role_data.role:
+        return user
+    
+    # Tokens carry the role, so outstanding ones are revoked
+    user = await update_returning(
+        db, User, [User.id == user_id],
+        {"role": role_data.role, "token_version": User.token_version + 1},
+    )
+    await db.commit()
+    principal_cache.invalidate(user.email)
     
     # Audit log
     log_admin_action(
@@ -132,3 +298,288 @@ def update_user_role(
     )
     
     return user
+
+@router.put("/roles", response_model=BulkRoleUpdateResult)
+async def bulk_update_user_roles(
+    role_data: BulkRoleUpdate,
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(require(Permission.CHANGE_ROLES, detail="You don't have permission to change roles"))
+):
+    """
+    Change the role of every user selected by user_ids and/or filter.
+    
+    Runs in one transaction with set-based UPDATEs and emits one audit event.
+    """
+    if not is_known_role(role_data.role):
+        raise HTTPException(status_code=400, detail="Invalid role")
+    criteria = role_data.filter.model_dump(exclude_none=True) if role_data.filter else {}
+    if not role_data.user_ids and not criteria:
+        raise HTTPException(status_code=400, detail="Provide user_ids or at least one filter")
+    
+    # Users whose role actually changes (their emails are needed for cache invalidation)
+    stmt = filter_users(select(User.id, User.email, User.role).where(User.role != role_data.role), **criteria)
+    if role_data.user_ids:
+        ids = sorted(set(role_data.user_ids))
+        targets = []
+        for start in range(0, len(ids), USER_BULK_CHUNK_SIZE):
+            chunk = ids[start:start + USER_BULK_CHUNK_SIZE]
+            targets.extend((await db.execute(stmt.where(User.id.in_(chunk)))).all())
+    else:
+        targets = (await db.execute(stmt)).all()
+    
+    target_ids = [row.id for row in targets]
+    for start in range(0, len(target_ids), USER_BULK_CHUNK_SIZE):
+        chunk = target_ids[start:start + USER_BULK_CHUNK_SIZE]
+        # Tokens carry the role, so outstanding ones are revoked
+        await db.execute(
+            update(User)
+            .where(User.id.in_(chunk))
+            .values(role=role_data.role, token_version=User.token_version + 1)
+            .execution_options(synchronize_session=False)
+        )
+    await db.commit()
+    for row in targets:
+        principal_cache.invalidate(row.email)
+    
+    # One audit event for the whole batch
+    old_roles = {}
+    for row in targets:
+        old_roles[row.role] = old_roles.get(row.role, 0) + 1
+    log_admin_action(
+        admin_user=current_user.email,
+        action="BULK_UPDATE_USER_ROLE",
+        details={
+            "new_role": role_data.role,
+            "updated": len(targets),
+            "old_roles": old_roles,
+            "user_ids": target_ids,
+            "filter": criteria,
+        }
+    )
+    
+    return {"role": role_data.role, "updated": len(targets)}
+
+def _import_format(request: Request, file: Optional[UploadFile], format: Optional[str]) -> str:
+    if format:
+        return format
+    if file is not None:
+        filename = (file.filename or "").lower()
+        return "ndjson" if filename.endswith((".ndjson", ".jsonl")) else "csv"
+    content_type = request.headers.get("content-type", "").split(";")[0].strip().lower()
+    return "ndjson" if content_type in (NDJSON_MEDIA_TYPE, "application/jsonl") else "csv"
+
+class _RequestBodyReader(io.RawIOBase):
+    """
+    Blocking reads of the request body for the parser's worker thread: each
+    read pulls the next chunk from the event loop (anyio.from_thread), so
+    rows are parsed as the client sends them
+    """
+    
+    def __init__(self, request: Request):
+        self._chunks = request.stream()
+        self._buffer = b""
+    
+    def readable(self) -> bool:
+        return True
+    
+    async def _next_chunk(self) -> Optional[bytes]:
+        try:
+            return await self._chunks.__anext__()
+        except StopAsyncIteration:
+            return None
+    
+    def readinto(self, buffer) -> int:
+        while not self._buffer:
+            chunk = from_thread.run(self._next_chunk)
+            if chunk is None:
+                return 0
+            self._buffer = chunk
+        size = min(len(buffer), len(self._buffer))
+        buffer[:size] = self._buffer[:size]
+        self._buffer = self._buffer[size:]
+        return size
+
+def _iter_import_rows(text, fmt: str):
+    """Yield (line number, row dict or error message) from a CSV or NDJSON stream"""
+    if fmt == "csv":
+        reader = csv.DictReader(text)
+        for row in reader:
+            yield reader.line_num, row
+        return
+    for line_number, line in enumerate(text, start=1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as e:
+            yield line_number, f"Invalid JSON: {e}"
+            continue
+        yield line_number, row if isinstance(row, dict) else "Expected a JSON object"
+
+@router.post("/import", response_model=UserImportResult)
+async def import_users(
+    request: Request,
+    file: Optional[UploadFile] = File(None, description="Multipart upload; send the file as the request body (text/csv or application/x-ndjson) to stream it instead"),
+    format: Optional[str] = Query(None, pattern="^(csv|ndjson)$", description="Defaults to the file extension (.ndjson/.jsonl, otherwise csv)"),
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(require(Permission.EDIT_USERS, detail="You don't have permission to import users"))
+):
+    """
+    Create users from a CSV (header row) or NDJSON file.
+    
+    Columns: email, password, role and the profile fields. A file sent as
+    the request body is parsed while it arrives, so memory stays flat
+    whatever its size; a multipart upload is spooled (to disk past 1 MB)
+    before parsing starts. Rows are processed in batches; each batch is
+    validated, hashed and bulk-inserted in its own transaction, so a
+    failure part way keeps the batches already imported. Existing emails
+    are skipped.
+    """
+    fmt = _import_format(request, file, format)
+    can_assign_roles = has_permission(current_user.role, Permission.CHANGE_ROLES)
+    source = file.file if file is not None else io.BufferedReader(_RequestBodyReader(request))
+    text = io.TextIOWrapper(source, encoding="utf-8-sig", newline="" if fmt == "csv" else None)
+    rows = _iter_import_rows(text, fmt)
+    
+    created = skipped = failed = 0
+    errors = []
+    seen = set()
+    
+    def fail(line: int, email: Optional[str], error: str):
+        nonlocal failed
+        failed += 1
+        if len(errors) < USER_IMPORT_MAX_ERRORS:
+            errors.append(UserImportError(line=line, email=email, error=error))
+    
+    while True:
+        # Parsing blocks on the spooled upload (maybe on disk) or the request body
+        try:
+            batch = await run_in_threadpool(lambda: list(islice(rows, USER_IMPORT_BATCH_SIZE)))
+        except (UnicodeDecodeError, csv.Error) as e:
+            raise HTTPException(status_code=400, detail=f"Could not read import file: {e}")
+        if not batch:
+            break
+        
+        pending = []
+        for line, row in batch:
+            if isinstance(row, str):
+                fail(line, None, row)
+                continue
+            values = {k: v for k, v in row.items() if k in USER_IMPORT_FIELDS + ("password",) and v not in (None, "")}
+            try:
+                user_data = UserCreate.model_validate(values)
+            except ValidationError as e:
+                fail(line, values.get("email"), "; ".join(f"{'.'.join(map(str, err['loc']))}: {err['msg']}" for err in e.errors()))
+                continue
+            role = row.get("role") or UserRole.USER.value
+            if not is_known_role(role):
+                fail(line, user_data.email, f"Invalid role: {role}")
+                continue
+            if role != UserRole.USER.value and not can_assign_roles:
+                fail(line, user_data.email, "You don't have permission to assign roles")
+                continue
+            # Emails are unique regardless of casing
+            if user_data.email.lower() in seen:
+                skipped += 1
+                continue
+            seen.add(user_data.email.lower())
+            pending.append((line, user_data, role))
+        if not pending:
+            continue
+        
+        lowered = func.lower(User.email)
+        existing = set((await db.scalars(
+            select(lowered).where(lowered.in_([user_data.email.lower() for _, user_data, _ in pending]))
+        )).all())
+        skipped += sum(1 for _, user_data, _ in pending if user_data.email.lower() in existing)
+        pending = [entry for entry in pending if entry[1].email.lower() not in existing]
+        if not pending:
+            continue
+        
+        hashed = await hash_passwords_async([user_data.password for _, user_data, _ in pending])
+        values = [
+            {
+                **user_data.model_dump(include=set(USER_IMPORT_FIELDS)),
+                "hashed_password": hashed_password,
+                "role": role,
+                "is_active": True,
+            }
+            for (_, user_data, role), hashed_password in zip(pending, hashed)
+        ]
+        try:
+            await db.execute(insert(User), values)
+            await db.commit()
+        except IntegrityError:
+            # Lost a race with another insert of the same email
+            await db.rollback()
+            for line, user_data, _ in pending:
+                fail(line, user_data.email, "Conflicts with a user created during the import")
+            continue
+        created += len(values)
+    
+    log_admin_action(
+        admin_user=current_user.email,
+        action="BULK_IMPORT_USERS",
+        details={"format": fmt, "filename": file.filename if file is not None else None, "created": created, "skipped": skipped, "failed": failed}
+    )
+    
+    return {"created": created, "skipped": skipped, "failed": failed, "errors": errors}
+
+EXPORT_MEDIA_TYPES = {"csv": "text/csv", "ndjson": NDJSON_MEDIA_TYPE, "json": "application/json"}
+
+def _export_value(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+async def _export_chunks(stmt, fmt: str, from_primary: bool):
+    """Encode rows as they are fetched, one chunk per yield_per partition"""
+    # The request's session is closed before a streaming body is sent, so use our own
+    async with await replica_pool.session(from_primary) as db:
+        result = await db.stream(stmt.execution_options(yield_per=USER_EXPORT_BATCH_SIZE))
+        if fmt == "csv":
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            writer.writerow(USER_LIST_FIELDS)
+            async for partition in result.partitions():
+                writer.writerows([_export_value(v) for v in row] for row in partition)
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+            if buffer.tell():
+                yield buffer.getvalue()
+        elif fmt == "ndjson":
+            async for partition in result.partitions():
+                yield ndjson(dict(zip(USER_LIST_FIELDS, row)) for row in partition)
+        else:
+            async def batches():
+                async for partition in result.partitions():
+                    yield [dict(zip(USER_LIST_FIELDS, row)) for row in partition]
+            async for chunk in json_array_chunks(batches()):
+                yield chunk
+
+@router.get("/export")
+async def export_users(
+    request: Request,
+    format: str = Query("csv", pattern="^(csv|ndjson|json)$"),
+    role: Optional[str] = None,
+    department: Optional[str] = None,
+    country: Optional[str] = None,
+    is_active: Optional[bool] = None,
+    current_user: User = Depends(require(Permission.VIEW_USERS, detail="You don't have permission to view users"))
+):
+    """Stream every matching user as CSV, NDJSON or a JSON array, ordered by id"""
+    stmt = filter_users(
+        select(*(getattr(User, f) for f in USER_LIST_FIELDS)).order_by(User.id),
+        role, department, country, is_active,
+    )
+    
+    log_admin_action(
+        admin_user=current_user.email,
+        action="EXPORT_USERS",
+        details={"format": format, "filter": {"role": role, "department": department, "country": country, "is_active": is_active}}
+    )
+    
+    return StreamingResponse(
+        _export_chunks(stmt, format, reads_from_primary(request)),
+        media_type=EXPORT_MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="users.{format}"'},
+    )
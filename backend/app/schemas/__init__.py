@@ -1,4 +1,5 @@
 from app.schemas.schemas import (
     UserBase, UserCreate, UserUpdate, UserResponse, UserRoleUpdate,
+    UserFilter, BulkRoleUpdate, BulkRoleUpdateResult, UserImportError, UserImportResult,
     Token, TokenData, LoginRequest, ConfigItem, ConfigResponse
 )
@@ -1,7 +1,9 @@
-from pydantic import BaseModel, EmailStr
-from typing import Optional
+from pydantic import BaseModel, EmailStr, computed_field
+from typing import Dict, List, Optional
 from datetime import datetime
 
+from app.avatars import avatar_variants
+
 class UserBase(BaseModel):
     email: EmailStr
     full_name: Optional[str] = None
@@ -33,12 +35,44 @@ class UserResponse(UserBase):
     avatar_url: Optional[str] = None
     created_at: Optional[datetime] = None
     
+    @computed_field
+    @property
+    def avatar_variants(self) -> Optional[Dict[str, str]]:
+        """Resized avatar URLs keyed by edge length in px"""
+        return avatar_variants(self.avatar_url)
+    
     class Config:
         from_attributes = True
 
 class UserRoleUpdate(BaseModel):
     role: str
 
+class UserFilter(BaseModel):
+    role: Optional[str] = None
+    department: Optional[str] = None
+    country: Optional[str] = None
+    is_active: Optional[bool] = None
+
+class BulkRoleUpdate(BaseModel):
+    role: str
+    user_ids: Optional[List[int]] = None
+    filter: Optional[UserFilter] = None
+
+class BulkRoleUpdateResult(BaseModel):
+    role: str
+    updated: int
+
+class UserImportError(BaseModel):
+    line: int
+    email: Optional[str] = None
+    error: str
+
+class UserImportResult(BaseModel):
+    created: int
+    skipped: int
+    failed: int
+    errors: List[UserImportError]
+
 class Token(BaseModel):
     access_token: str
     token_type: str
@@ -0,0 +1,69 @@
+"""
+Fast JSON encoding for list endpoints
+Rows selected as plain columns are encoded straight to bytes (orjson when
+available) and typed models go through precompiled TypeAdapters, skipping
+FastAPI's response_model validation and jsonable_encoder pass.
+"""
+import json
+from datetime import date, datetime
+from typing import Any, AsyncIterator, Iterable, Tuple
+
+from fastapi import Response
+from pydantic import TypeAdapter
+
+from app.schemas import ConfigResponse
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional speedup
+    orjson = None
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+# Precompiled serializers for snapshot payloads
+config_list_adapter = TypeAdapter(Tuple[ConfigResponse, ...])
+config_adapter = TypeAdapter(ConfigResponse)
+
+
+def _default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+if orjson is not None:
+    def dumps(value: Any) -> bytes:
+        # UTC as "Z", matching pydantic's output
+        return orjson.dumps(value, option=orjson.OPT_UTC_Z)
+else:
+    def dumps(value: Any) -> bytes:
+        return json.dumps(value, default=_default, separators=(",", ":")).encode()
+
+
+class JSONBytesResponse(Response):
+    """JSON response whose content is already encoded (or is encoded with dumps)"""
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return content if isinstance(content, bytes) else dumps(content)
+
+
+def ndjson(items: Iterable[Any]) -> bytes:
+    return b"".join(dumps(item) + b"\n" for item in items)
+
+
+def wants_ndjson(accept: str) -> bool:
+    return NDJSON_MEDIA_TYPE in (accept or "")
+
+
+async def json_array_chunks(batches: AsyncIterator[Iterable[Any]]) -> AsyncIterator[bytes]:
+    """Encode batches of items as one JSON array, a batch per chunk"""
+    first = True
+    yield b"["
+    async for batch in batches:
+        encoded = b",".join(dumps(item) for item in batch)
+        if not encoded:
+            continue
+        yield encoded if first else b"," + encoded
+        first = False
+    yield b"]"
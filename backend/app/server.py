@@ -0,0 +1,110 @@
+"""
+Multi-process launcher
+
+    python -m app.server
+
+Runs uvicorn with one worker process per available CPU (WEB_CONCURRENCY
+overrides), after doing the once-per-deploy work in the parent:
+
+    - applies pending migrations, so workers start with AUTO_MIGRATE=false
+    - serves the coordination hub (app/coordination.py) the workers use to
+      broadcast cache invalidations and share login rate-limit counters
+    - splits the CPUs between the workers' bcrypt pools (HASH_WORKERS)
+    - splits DB_MAX_CONNECTIONS between the workers' DB pools
+
+With a single worker it simply runs uvicorn in-process with local state.
+"""
+import logging
+import math
+import os
+import tempfile
+
+import uvicorn
+
+# Worker processes; "auto" uses the CPUs this container may run on
+WEB_CONCURRENCY = os.getenv("WEB_CONCURRENCY", "auto")
+# Upper bound for the automatic worker count (each worker has its own DB pool)
+WEB_MAX_WORKERS = int(os.getenv("WEB_MAX_WORKERS", "8"))
+HOST = os.getenv("HOST", "0.0.0.0")
+PORT = int(os.getenv("PORT", "8000"))
+LOG_LEVEL = os.getenv("LOG_LEVEL", "info")
+# Database connections all workers together may open (empty: each worker
+# uses DB_POOL_SIZE + DB_MAX_OVERFLOW); keep it below the server's max_connections
+DB_MAX_CONNECTIONS = os.getenv("DB_MAX_CONNECTIONS", "")
+# Apply migrations in the launcher before starting workers
+MIGRATE_ON_START = os.getenv("AUTO_MIGRATE", "true").lower() in ("1", "true", "yes")
+
+logger = logging.getLogger("app.server")
+
+
+def available_cpus() -> int:
+    """CPUs usable by this process: affinity mask, capped by a cgroup v2 CPU quota"""
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = os.cpu_count() or 1
+    try:
+        with open("/sys/fs/cgroup/cpu.max") as f:
+            quota, period = f.read().split()
+        if quota != "max":
+            cpus = min(cpus, math.ceil(int(quota) / int(period)))
+    except (OSError, ValueError):
+        pass
+    return max(1, cpus)
+
+
+def worker_count(setting: str = WEB_CONCURRENCY) -> int:
+    if setting.lower() != "auto":
+        return max(1, int(setting))
+    return max(1, min(available_cpus(), WEB_MAX_WORKERS))
+
+
+def pool_budget(max_connections: int, workers: int):
+    """(pool_size, max_overflow) per worker so that all workers stay within max_connections"""
+    per_worker = max(1, max_connections // workers)
+    # A third kept open, the rest opened under load (the 1:2 of the defaults)
+    pool_size = max(1, per_worker // 3)
+    return pool_size, per_worker - pool_size
+
+
+def main():
+    logging.basicConfig(level=LOG_LEVEL.upper(), format="%(message)s")
+    workers = worker_count()
+    cpus = available_cpus()
+    # Workers read these at import, so they must be set before uvicorn spawns them
+    os.environ.setdefault("HASH_WORKERS", str(max(1, cpus // workers)))
+    if DB_MAX_CONNECTIONS:
+        pool_size, max_overflow = pool_budget(int(DB_MAX_CONNECTIONS), workers)
+        os.environ.setdefault("DB_POOL_SIZE", str(pool_size))
+        os.environ.setdefault("DB_MAX_OVERFLOW", str(max_overflow))
+        logger.info("DB pool per worker: %s + %s overflow", os.environ["DB_POOL_SIZE"], os.environ["DB_MAX_OVERFLOW"])
+
+    if MIGRATE_ON_START:
+        from app.models import migrations
+        applied = migrations.upgrade()
+        logger.info("Schema at version %s (applied %s)", migrations.current_version(), applied or "none")
+        migrations.engine.dispose()
+        os.environ["AUTO_MIGRATE"] = "false"
+
+    if workers == 1:
+        logger.info("Starting 1 worker on %s CPU(s)", cpus)
+        uvicorn.run("app.main:app", host=HOST, port=PORT, log_level=LOG_LEVEL)
+        return
+
+    from app.coordination import CoordinationHub
+    socket_path = os.getenv("COORDINATION_SOCKET") or os.path.join(
+        tempfile.gettempdir(), f"poc-coordination-{os.getpid()}.sock")
+    hub = CoordinationHub(socket_path)
+    hub.start()
+    os.environ.setdefault("COORDINATION_BACKEND", "unix")
+    os.environ["COORDINATION_SOCKET"] = socket_path
+    os.environ.setdefault("RATE_LIMIT_BACKEND", "coordinated")
+    logger.info("Starting %s workers on %s CPU(s), coordination hub at %s", workers, cpus, socket_path)
+    try:
+        uvicorn.run("app.main:app", host=HOST, port=PORT, workers=workers, log_level=LOG_LEVEL)
+    finally:
+        hub.stop()
+
+
+if __name__ == "__main__":
+    main()
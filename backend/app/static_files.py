@@ -0,0 +1,212 @@
+"""
+Serving of content-addressed files (uploads and avatar variants)
+A file's name is the hash of its content, so responses are cached as
+immutable, and revalidation (If-None-Match against the hash,
+If-Modified-Since) and single byte ranges are answered without reading
+the file. Bodies go out through the server's zero-copy extensions when it
+advertises one (http.response.zerocopysend, i.e. sendfile(2), or
+http.response.pathsend); otherwise they are read off the event loop in
+STATIC_CHUNK_SIZE chunks.
+
+Nothing here touches the database or the API key; /uploads sits outside
+/api/ and the variant route is exempt in app/main.py.
+"""
+import mimetypes
+import os
+import stat
+from email.utils import parsedate_to_datetime
+from typing import Optional, Tuple
+
+from fastapi import Request
+from starlette.responses import FileResponse, PlainTextResponse, Response
+
+from app.avatars import avatar_name
+from app.http_cache import etag_matches, not_modified
+from app.metrics import run_in_threadpool
+from app.storage import LocalStorage
+
+# Bytes read per chunk when the server has no zero-copy extension
+STATIC_CHUNK_SIZE = int(os.getenv("STATIC_CHUNK_SIZE", str(256 * 1024)))
+
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+# Uploads are user content: only images are served with their own type,
+# and nothing may run scripts on the API's origin (e.g. inside an SVG)
+UPLOAD_SECURITY_HEADERS = {
+    "X-Content-Type-Options": "nosniff",
+    "Content-Security-Policy": "default-src 'none'; style-src 'unsafe-inline'; sandbox",
+}
+
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+
+def parse_range(range_header: str, size: int) -> Optional[Tuple[int, int]]:
+    """
+    [start, end) of a single "bytes=" range, or None to send the whole file
+    (malformed, other units and multiple ranges are ignored, as RFC 9110 allows).
+
+    Raises:
+        RangeNotSatisfiable: the range starts past the end of the file
+    """
+    unit, _, spec = range_header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        return None
+    first, sep, last = (part.strip() for part in spec.partition("-"))
+    if not sep or not (first or last) or any(part and not part.isdigit() for part in (first, last)):
+        return None
+    if not first:
+        # Suffix range: the last N bytes
+        if int(last) == 0 or size == 0:
+            raise RangeNotSatisfiable()
+        return max(size - int(last), 0), size
+    start = int(first)
+    if last and int(last) < start:
+        return None
+    if start >= size:
+        raise RangeNotSatisfiable()
+    return start, min(int(last) + 1, size) if last else size
+
+
+class ContentAddressedFileResponse(FileResponse):
+    """
+    FileResponse for a file that never changes under its name: strong ETag
+    from the name, 304s, Range/If-Range and zero-copy sending when available
+    """
+
+    def __init__(self, path: str, stat_result: os.stat_result, etag: str, media_type: Optional[str] = None,
+                 headers: Optional[dict] = None):
+        super().__init__(
+            path, stat_result=stat_result, media_type=media_type,
+            headers={"ETag": etag, "Cache-Control": IMMUTABLE_CACHE_CONTROL, "Accept-Ranges": "bytes", **(headers or {})},
+        )
+        self.etag = etag
+
+    async def __call__(self, scope, receive, send):
+        request = Request(scope)
+        size = self.stat_result.st_size
+        if self._not_modified(request):
+            response = not_modified(self.etag, {
+                "Cache-Control": IMMUTABLE_CACHE_CONTROL, "Last-Modified": self.headers["last-modified"],
+            })
+            await response(scope, receive, send)
+            return
+
+        start, end = 0, size
+        range_header = request.headers.get("range")
+        if range_header and self._if_range(request):
+            try:
+                byte_range = parse_range(range_header, size)
+            except RangeNotSatisfiable:
+                response = Response(status_code=416, headers={"Content-Range": f"bytes */{size}"})
+                await response(scope, receive, send)
+                return
+            if byte_range is not None:
+                start, end = byte_range
+                self.status_code = 206
+                self.headers["Content-Range"] = f"bytes {start}-{end - 1}/{size}"
+                self.headers["Content-Length"] = str(end - start)
+
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        if scope["method"].upper() == "HEAD" or start == end:
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+        else:
+            await self._send_body(scope, send, start, end - start)
+
+    def _not_modified(self, request: Request) -> bool:
+        # If-None-Match takes precedence; the content hash settles it exactly
+        if "if-none-match" in request.headers:
+            return etag_matches(request, self.etag)
+        if_modified_since = request.headers.get("if-modified-since")
+        if not if_modified_since:
+            return False
+        try:
+            return int(self.stat_result.st_mtime) <= parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+
+    def _if_range(self, request: Request) -> bool:
+        """Whether a Range request applies to this file (If-Range absent or still current)"""
+        if_range = request.headers.get("if-range")
+        if not if_range:
+            return True
+        if if_range.startswith(('"', "W/")):
+            return if_range == self.etag
+        return if_range == self.headers["last-modified"]
+
+    async def _send_body(self, scope, send, offset: int, count: int):
+        extensions = scope.get("extensions") or {}
+        if "http.response.zerocopysend" in extensions:
+            file = await run_in_threadpool(open, self.path, "rb")
+            try:
+                await send({"type": "http.response.zerocopysend", "file": file, "offset": offset, "count": count})
+            finally:
+                file.close()
+            return
+        if "http.response.pathsend" in extensions and offset == 0 and count == self.stat_result.st_size:
+            await send({"type": "http.response.pathsend", "path": self.path})
+            return
+
+        fd = await run_in_threadpool(os.open, self.path, os.O_RDONLY)
+        try:
+            while count > 0:
+                chunk = await run_in_threadpool(os.pread, fd, min(STATIC_CHUNK_SIZE, count), offset)
+                if not chunk:
+                    # Shorter than its stat said; end the response rather than stall
+                    count = 0
+                offset += len(chunk)
+                count -= len(chunk)
+                await send({"type": "http.response.body", "body": chunk, "more_body": count > 0})
+        finally:
+            os.close(fd)
+
+
+async def content_addressed_file(path: str, etag: str, media_type: Optional[str] = None,
+                                 headers: Optional[dict] = None) -> Optional[ContentAddressedFileResponse]:
+    """Response for a regular file at path, or None if there is none"""
+    try:
+        stat_result = await run_in_threadpool(os.stat, path)
+    except (FileNotFoundError, NotADirectoryError):
+        return None
+    if not stat.S_ISREG(stat_result.st_mode):
+        return None
+    return ContentAddressedFileResponse(path, stat_result, etag, media_type, headers)
+
+
+def upload_media_type(name: str) -> str:
+    media_type = mimetypes.guess_type(name)[0]
+    return media_type if media_type and media_type.startswith("image/") else "application/octet-stream"
+
+
+class UploadFiles:
+    """
+    ASGI app serving LocalStorage uploads, mounted at its url_prefix. Only
+    content-addressed names directly under the listed directories are served.
+    """
+
+    def __init__(self, storage: LocalStorage, directories=("avatars",)):
+        self.storage = storage
+        self.directories = frozenset(directories)
+        # Route template that labels these requests in /metrics (MetricsMiddleware reads scope["route"].path)
+        self.path = f"{storage.url_prefix}/{{directory}}/{{name}}"
+
+    async def __call__(self, scope, receive, send):
+        scope["route"] = self
+        if scope["method"] not in ("GET", "HEAD"):
+            response = PlainTextResponse("Method Not Allowed", status_code=405, headers={"Allow": "GET, HEAD"})
+            await response(scope, receive, send)
+            return
+
+        # The mount puts its prefix into root_path; what remains is the storage key
+        key = scope["path"][len(scope.get("root_path", "")):].lstrip("/")
+        directory, _, name = key.partition("/")
+        response = None
+        if directory in self.directories and avatar_name(name) == name:
+            response = await content_addressed_file(
+                self.storage.path_for(key), f'"{name}"', upload_media_type(name),
+                headers=UPLOAD_SECURITY_HEADERS,
+            )
+        if response is None:
+            response = PlainTextResponse("Not Found", status_code=404)
+        await response(scope, receive, send)
@@ -0,0 +1,250 @@
+"""
+Content-addressed file storage for uploads
+Uploads are streamed chunk by chunk into a backend and stored under the
+SHA-256 of their content, so identical files are stored once.
+
+Backends:
+    local  - files under UPLOAD_DIR, served from /uploads (default)
+    azure  - Azure Blob Storage container
+    memory - in-process dict, a stand-in for tests and benchmarks
+"""
+import hashlib
+import os
+import re
+import tempfile
+import uuid
+from abc import ABC, abstractmethod
+from typing import AsyncIterator, Dict, Optional
+
+import aiofiles
+import aiofiles.os
+
+from app.metrics import run_in_threadpool
+
+# Which backend stores uploads: local | azure | memory
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "local")
+# Root directory for the local backend
+UPLOAD_DIR = os.getenv("UPLOAD_DIR", "uploads")
+# Azure Blob Storage settings for the azure backend
+AZURE_STORAGE_CONNECTION_STRING = os.getenv("AZURE_STORAGE_CONNECTION_STRING", "")
+AZURE_STORAGE_CONTAINER = os.getenv("AZURE_STORAGE_CONTAINER", "uploads")
+# Bytes read from the upload per chunk
+UPLOAD_CHUNK_SIZE = 64 * 1024
+
+_SUFFIX_RE = re.compile(r"^\.[a-z0-9]{1,8}$")
+
+
+class UploadTooLarge(Exception):
+    """Raised when an upload exceeds its size limit"""
+
+    def __init__(self, max_size: int):
+        super().__init__(f"Upload exceeds {max_size} bytes")
+        self.max_size = max_size
+
+
+def safe_suffix(filename: Optional[str]) -> str:
+    """File extension of an uploaded filename, or "" if it is not a plain extension"""
+    suffix = os.path.splitext(filename or "")[1].lower()
+    return suffix if _SUFFIX_RE.match(suffix) else ""
+
+
+class StorageBackend(ABC):
+    """
+    Base class for content-addressed storage.
+
+    Subclasses implement _open/_write/_commit/_discard; save() handles
+    hashing, size enforcement and cleanup.
+    """
+
+    async def save(self, chunks: AsyncIterator[bytes], prefix: str, suffix: str = "", max_size: Optional[int] = None) -> str:
+        """
+        Stream chunks into storage and return the content-addressed key.
+
+        Raises:
+            UploadTooLarge: as soon as more than max_size bytes have been read
+        """
+        digest = hashlib.sha256()
+        size = 0
+        handle = await self._open()
+        try:
+            async for chunk in chunks:
+                size += len(chunk)
+                if max_size is not None and size > max_size:
+                    raise UploadTooLarge(max_size)
+                digest.update(chunk)
+                await self._write(handle, chunk)
+            key = f"{prefix}/{digest.hexdigest()}{suffix}"
+            await self._commit(handle, key)
+        except BaseException:
+            await self._discard(handle)
+            raise
+        return key
+
+    @abstractmethod
+    def url_for(self, key: str) -> str:
+        """URL clients fetch a stored object from"""
+
+    @abstractmethod
+    async def read(self, key: str) -> Optional[bytes]:
+        """Full content of a stored object, or None if it does not exist"""
+
+    @abstractmethod
+    async def _open(self):
+        """Start an upload; returns the handle passed to the methods below"""
+
+    @abstractmethod
+    async def _write(self, handle, chunk: bytes):
+        """Append a chunk to the upload"""
+
+    @abstractmethod
+    async def _commit(self, handle, key: str):
+        """Store the finished upload under key"""
+
+    @abstractmethod
+    async def _discard(self, handle):
+        """Throw away an unfinished upload"""
+
+
+class LocalStorage(StorageBackend):
+    """Files under a local directory, written through a temp file and renamed into place"""
+
+    def __init__(self, root: str, url_prefix: str = "/uploads"):
+        self.root = root
+        self.url_prefix = url_prefix.rstrip("/")
+
+    def path_for(self, key: str) -> str:
+        return os.path.join(self.root, *key.split("/"))
+
+    def url_for(self, key: str) -> str:
+        return f"{self.url_prefix}/{key}"
+
+    async def read(self, key: str) -> Optional[bytes]:
+        try:
+            async with aiofiles.open(self.path_for(key), "rb") as f:
+                return await f.read()
+        except FileNotFoundError:
+            return None
+
+    async def _open(self):
+        await aiofiles.os.makedirs(self.root, exist_ok=True)
+        path = os.path.join(self.root, f".upload-{uuid.uuid4().hex}")
+        return path, await aiofiles.open(path, "wb")
+
+    async def _write(self, handle, chunk: bytes):
+        await handle[1].write(chunk)
+
+    async def _commit(self, handle, key: str):
+        tmp_path, f = handle
+        await f.close()
+        final_path = self.path_for(key)
+        if await aiofiles.os.path.exists(final_path):
+            # Same content already stored
+            await aiofiles.os.remove(tmp_path)
+            return
+        await aiofiles.os.makedirs(os.path.dirname(final_path), exist_ok=True)
+        await aiofiles.os.replace(tmp_path, final_path)
+
+    async def _discard(self, handle):
+        tmp_path, f = handle
+        await f.close()
+        if await aiofiles.os.path.exists(tmp_path):
+            await aiofiles.os.remove(tmp_path)
+
+
+class MemoryStorage(StorageBackend):
+    """In-process store with the same interface; a stand-in for Azure in tests"""
+
+    def __init__(self, url_prefix: str = "/uploads"):
+        self.url_prefix = url_prefix.rstrip("/")
+        self.blobs: Dict[str, bytes] = {}
+
+    def url_for(self, key: str) -> str:
+        return f"{self.url_prefix}/{key}"
+
+    async def read(self, key: str) -> Optional[bytes]:
+        return self.blobs.get(key)
+
+    async def _open(self):
+        return bytearray()
+
+    async def _write(self, handle, chunk: bytes):
+        handle.extend(chunk)
+
+    async def _commit(self, handle, key: str):
+        self.blobs.setdefault(key, bytes(handle))
+
+    async def _discard(self, handle):
+        handle.clear()
+
+
+class AzureBlobStorage(StorageBackend):
+    """
+    Azure Blob Storage container.
+
+    The content hash is only known once the upload has been read, so chunks
+    are spooled to a temporary file (in memory up to 1 MB) and uploaded
+    under their final key; existing blobs are not uploaded again.
+    """
+
+    def __init__(self, connection_string: str, container: str):
+        # Imported lazily: azure-storage-blob is only needed for this backend
+        from azure.storage.blob import ContainerClient
+        self.container = ContainerClient.from_connection_string(connection_string, container)
+
+    def url_for(self, key: str) -> str:
+        return self.container.get_blob_client(key).url
+
+    async def read(self, key: str) -> Optional[bytes]:
+        return await run_in_threadpool(self._download, key)
+
+    def _download(self, key: str) -> Optional[bytes]:
+        from azure.core.exceptions import ResourceNotFoundError
+        try:
+            return self.container.get_blob_client(key).download_blob().readall()
+        except ResourceNotFoundError:
+            return None
+
+    async def _open(self):
+        return tempfile.SpooledTemporaryFile(max_size=1024 * 1024)
+
+    async def _write(self, handle, chunk: bytes):
+        await run_in_threadpool(handle.write, chunk)
+
+    async def _commit(self, handle, key: str):
+        await run_in_threadpool(self._upload, handle, key)
+        handle.close()
+
+    def _upload(self, handle, key: str):
+        from azure.core.exceptions import ResourceExistsError
+        blob = self.container.get_blob_client(key)
+        if blob.exists():
+            return
+        handle.seek(0)
+        try:
+            blob.upload_blob(handle, overwrite=False)
+        except ResourceExistsError:
+            # Uploaded concurrently with identical content
+            pass
+
+    async def _discard(self, handle):
+        handle.close()
+
+
+def create_storage(backend: str = STORAGE_BACKEND) -> StorageBackend:
+    if backend == "azure":
+        return AzureBlobStorage(AZURE_STORAGE_CONNECTION_STRING, AZURE_STORAGE_CONTAINER)
+    if backend == "memory":
+        return MemoryStorage()
+    return LocalStorage(UPLOAD_DIR)
+
+
+storage = create_storage()
+
+
+async def iter_upload(upload, chunk_size: int = UPLOAD_CHUNK_SIZE) -> AsyncIterator[bytes]:
+    """Read a Starlette UploadFile in chunks"""
+    while True:
+        chunk = await upload.read(chunk_size)
+        if not chunk:
+            return
+        yield chunk
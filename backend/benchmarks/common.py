@@ -0,0 +1,130 @@
+"""
+Shared helpers for the benchmark suite: seeding, statistics, RSS and
+result files.
+"""
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, List, Optional
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+RESULTS_DIR = Path(__file__).resolve().parent / "results"
+
+# Password given to every seeded user
+SEED_PASSWORD = "bench-password"
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=BACKEND_DIR, capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def environment() -> dict:
+    return {
+        "git_revision": git_revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+    }
+
+
+def latency_stats(samples: List[float]) -> Dict[str, float]:
+    """Latency percentiles in milliseconds from samples in seconds"""
+    if not samples:
+        return {}
+    ordered = sorted(samples)
+
+    def pct(p):
+        return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))] * 1000
+
+    return {
+        "count": len(ordered),
+        "mean_ms": sum(ordered) / len(ordered) * 1000,
+        "min_ms": ordered[0] * 1000,
+        "p50_ms": pct(50),
+        "p95_ms": pct(95),
+        "p99_ms": pct(99),
+        "max_ms": ordered[-1] * 1000,
+    }
+
+
+def rss_bytes(pid: Optional[int] = None) -> Optional[int]:
+    """Resident set size of a process (Linux /proc), or peak RSS of this process elsewhere"""
+    status = Path(f"/proc/{pid or os.getpid()}/status")
+    try:
+        for line in status.read_text().splitlines():
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    if pid is None or pid == os.getpid():
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+    return None
+
+
+def seed_database(database_url: str, users: int, configs: int) -> List[str]:
+    """
+    Create the schema and insert users and extra config rows.
+
+    The first user is an admin. Returns the seeded emails.
+    """
+    from sqlalchemy import create_engine, insert
+    from app.models.migrations import upgrade
+    from app.models.user import User, SystemConfig, UserRole
+    from app.hashing import get_pwd_context
+
+    engine = create_engine(database_url)
+    upgrade(engine)
+    # Hash once: seeding must not take minutes of bcrypt
+    hashed = get_pwd_context().hash(SEED_PASSWORD)
+    departments = ["engineering", "sales", "support", "finance", "hr"]
+    countries = ["IN", "US", "DE", "BR", "JP"]
+    emails = [f"bench{i}@example.com" for i in range(users)]
+    rows = [
+        {
+            "email": email,
+            "hashed_password": hashed,
+            "full_name": f"Bench User {i}",
+            "department": departments[i % len(departments)],
+            "country": countries[i % len(countries)],
+            "role": UserRole.ADMIN.value if i == 0 else UserRole.USER.value,
+            "is_active": True,
+        }
+        for i, email in enumerate(emails)
+    ]
+    config_rows = [
+        {"key": f"bench_key_{i}", "value": f"value {i}", "description": "Benchmark config"}
+        for i in range(configs)
+    ]
+    with engine.begin() as conn:
+        for start in range(0, len(rows), 1000):
+            conn.execute(insert(User), rows[start:start + 1000])
+        if config_rows:
+            conn.execute(insert(SystemConfig), config_rows)
+    engine.dispose()
+    return emails
+
+
+def save_results(kind: str, payload: dict, output: Optional[str] = None) -> Path:
+    """Write results as JSON (default: benchmarks/results/<kind>-<rev>-<time>.json)"""
+    if output:
+        path = Path(output)
+    else:
+        stamp = time.strftime("%Y%m%d-%H%M%S")
+        path = RESULTS_DIR / f"{kind}-{payload['environment']['git_revision']}-{stamp}.json"
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps(payload, indent=2, sort_keys=True))
+    return path
@@ -0,0 +1,65 @@
+"""
+Compare two benchmark result files
+
+Prints per-scenario (load) or per-benchmark (micro) deltas between a
+baseline and a candidate run, and exits non-zero when any p95 latency
+regressed by more than --threshold percent.
+
+Usage (from backend/):
+    python -m benchmarks.compare benchmarks/results/load-abc123-*.json benchmarks/results/load-def456-*.json
+"""
+import argparse
+import json
+import sys
+
+METRICS = ("p50_ms", "p95_ms", "p99_ms")
+
+
+def load(path: str) -> dict:
+    with open(path) as f:
+        return json.load(f)
+
+
+def entries(result: dict) -> dict:
+    """name -> (latency stats, throughput) for either result kind"""
+    if "scenarios" in result:
+        return {name: (r["latency"], r["throughput_rps"]) for name, r in result["scenarios"].items()}
+    return {name: (stats, stats.get("ops_per_s", 0.0)) for name, stats in result["benchmarks"].items()}
+
+
+def pct_change(old: float, new: float) -> float:
+    return (new - old) / old * 100 if old else 0.0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("baseline")
+    parser.add_argument("candidate")
+    parser.add_argument("--threshold", type=float, default=10.0, help="Allowed p95 regression in percent")
+    args = parser.parse_args(argv)
+
+    baseline, candidate = load(args.baseline), load(args.candidate)
+    print(f"baseline  {baseline['environment']['git_revision']}  {baseline['environment']['timestamp']}")
+    print(f"candidate {candidate['environment']['git_revision']}  {candidate['environment']['timestamp']}")
+    if baseline.get("parameters") != candidate.get("parameters"):
+        print("warning: runs used different parameters; deltas may not be comparable")
+
+    old_entries, new_entries = entries(baseline), entries(candidate)
+    regressions = []
+    for name in sorted(old_entries.keys() & new_entries.keys()):
+        (old_stats, old_rate), (new_stats, new_rate) = old_entries[name], new_entries[name]
+        parts = [f"rate {pct_change(old_rate, new_rate):+6.1f}%"]
+        for metric in METRICS:
+            parts.append(f"{metric[:-3]} {old_stats[metric]:8.3f} -> {new_stats[metric]:8.3f} ms "
+                         f"({pct_change(old_stats[metric], new_stats[metric]):+6.1f}%)")
+        print(f"{name:>28}: " + "  ".join(parts))
+        if pct_change(old_stats["p95_ms"], new_stats["p95_ms"]) > args.threshold:
+            regressions.append(name)
+
+    if regressions:
+        print(f"p95 regressed by more than {args.threshold}%: {', '.join(regressions)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
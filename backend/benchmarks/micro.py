@@ -0,0 +1,167 @@
+"""
+In-process micro-benchmarks for hot paths
+
+Times the pieces every request goes through without HTTP or uvicorn in
+the way: token verification, principal lookup (cached and uncached),
+permission checks, response serialization and audit log enqueue. Also
+checks that update_returning refreshes objects already in the session.
+
+Usage (from backend/):
+    python -m benchmarks.micro --iterations 20000 --users 2000
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+from benchmarks.common import environment, latency_stats, rss_bytes, save_results, seed_database
+
+
+def configure_environment(database_url: str):
+    """Point the app at the benchmark database before it is imported"""
+    os.environ["DATABASE_URL"] = database_url
+    os.environ.setdefault("BCRYPT_ROUNDS", "4")
+    os.environ.setdefault("UPLOAD_DIR", os.path.join(tempfile.gettempdir(), "poc-bench-uploads"))
+
+
+def time_sync(fn, iterations: int) -> dict:
+    samples = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - started)
+    return summarize(samples)
+
+
+async def time_async(fn, iterations: int) -> dict:
+    samples = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        await fn()
+        samples.append(time.perf_counter() - started)
+    return summarize(samples)
+
+
+def summarize(samples) -> dict:
+    stats = latency_stats(samples)
+    total = sum(samples)
+    stats["ops_per_s"] = len(samples) / total if total else 0.0
+    return stats
+
+
+async def run(args) -> dict:
+    from app.models.database import AsyncSessionLocal, update_returning
+    from app.models.user import User
+    from app.permissions import Permission, has_permission
+    from app.principal_cache import principal_cache, token_cache
+    from app.routers.auth import create_access_token, get_current_user, get_token_claims, principal_claims
+    from app.schemas import UserResponse
+    from app.serialization import dumps
+    from app.routers.users import USER_LIST_FIELDS
+    from app import audit_logger
+    from sqlalchemy import select
+
+    results = {}
+    async with AsyncSessionLocal() as db:
+        admin = await db.scalar(select(User).where(User.email == "bench0@example.com"))
+        token = create_access_token(data=principal_claims(admin))
+
+        # Token verification: signature check vs verified-token cache
+        async def claims_uncached():
+            token_cache.clear()
+            await get_token_claims(token)
+        results["token_claims_uncached"] = await time_async(claims_uncached, args.iterations)
+        results["token_claims_cached"] = await time_async(lambda: get_token_claims(token), args.iterations)
+
+        claims = await get_token_claims(token)
+
+        # Principal lookup: database load vs principal cache
+        async def principal_uncached():
+            principal_cache.clear()
+            db.expunge_all()
+            await get_current_user(token, claims, db)
+        results["current_user_uncached"] = await time_async(principal_uncached, args.iterations // 10 or 1)
+        results["current_user_cached"] = await time_async(lambda: get_current_user(token, claims, db), args.iterations)
+
+        results["has_permission"] = time_sync(lambda: has_permission("admin", Permission.EDIT_CONFIG), args.iterations)
+
+        # Response serialization for a page of users: ORM + model vs column tuples + direct encoding
+        rows = (await db.scalars(select(User).order_by(User.id).limit(args.page_size))).all()
+        results[f"serialize_{len(rows)}_users"] = time_sync(
+            lambda: [UserResponse.model_validate(row).model_dump(mode="json") for row in rows],
+            max(args.iterations // 100, 10),
+        )
+        tuples = (await db.execute(
+            select(*(getattr(User, f) for f in USER_LIST_FIELDS)).order_by(User.id).limit(args.page_size)
+        )).all()
+        results[f"serialize_{len(tuples)}_users_fast"] = time_sync(
+            lambda: dumps([dict(zip(USER_LIST_FIELDS, row)) for row in tuples]),
+            max(args.iterations // 100, 10),
+        )
+
+        # Regression check: update_returning must refresh a row the session
+        # already holds with the server-side values (updated_at, row_version)
+        held = await db.get(User, admin.id)
+        updated = await update_returning(db, User, [User.id == admin.id], {"city": f"bench-{held.row_version}"})
+        await db.commit()
+        async with AsyncSessionLocal() as fresh:
+            stored = await fresh.scalar(select(User).where(User.id == admin.id))
+        if updated is not held or (updated.updated_at, updated.row_version) != (stored.updated_at, stored.row_version):
+            raise RuntimeError("update_returning returned a stale object")
+
+    # Audit enqueue on the request path; the writer thread goes to /dev/null
+    listener = audit_logger.audit_listener
+    if listener is not None:
+        previous_stream = listener.stream
+        listener.stream = open(os.devnull, "w")
+        try:
+            results["audit_enqueue"] = time_sync(
+                lambda: audit_logger.log_auth_event("bench0@example.com", "LOGIN", True, "127.0.0.1"),
+                args.iterations,
+            )
+            audit_logger.flush_audit_logging()
+        finally:
+            listener.stream.close()
+            listener.stream = previous_stream
+
+    return results
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database-url", help="Database to seed and use (default: temporary SQLite file)")
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--iterations", type=int, default=10000)
+    parser.add_argument("--page-size", type=int, default=100, help="Users serialized per iteration")
+    parser.add_argument("--output", help="Result file (default: benchmarks/results/micro-<rev>-<time>.json)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    database_url = args.database_url or f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='poc-bench-'), 'bench.db')}"
+    configure_environment(database_url)
+    seed_database(database_url, args.users, 0)
+
+    results = asyncio.run(run(args))
+    for name, stats in results.items():
+        print(f"{name:>28}: {stats['ops_per_s']:12.1f} ops/s  p50 {stats['p50_ms'] * 1000:9.2f} us  "
+              f"p99 {stats['p99_ms'] * 1000:9.2f} us")
+
+    payload = {
+        "environment": environment(),
+        "parameters": {
+            "database": database_url.split("://", 1)[0],
+            "users": args.users,
+            "iterations": args.iterations,
+            "page_size": args.page_size,
+        },
+        "benchmarks": results,
+        "rss_bytes": rss_bytes(),
+    }
+    print(f"Results written to {save_results('micro', payload, args.output)}")
+
+
+if __name__ == "__main__":
+    main()
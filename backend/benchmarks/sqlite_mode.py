@@ -0,0 +1,112 @@
+"""
+SQLite mode benchmark
+
+Runs the mixed read/write scenario (one write in five) against copies of
+the same seeded SQLite database, first with SQLITE_TUNED=false (plain
+rollback journal, a connection per session) and then with the tuned mode
+(WAL, pragmas, single writer connection plus reader pool), and reports
+throughput, latency and failed requests ("database is locked" shows up as
+500s) for each.
+
+Usage (from backend/):
+    python -m benchmarks.sqlite_mode --concurrency 32 --requests 2000
+    python -m benchmarks.sqlite_mode --workers 2
+"""
+import argparse
+import asyncio
+import os
+import shutil
+import tempfile
+
+import httpx
+
+from benchmarks.common import SEED_PASSWORD, environment, rss_bytes, save_results, seed_database
+from benchmarks.load import free_port, mixed_request, run_scenario, start_server, wait_until_healthy
+
+MODES = {"untuned": "false", "tuned": "true"}
+
+
+async def run_mode(database_url: str, tuned: str, email: str, args, workdir: str) -> dict:
+    port = free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    env_overrides = {
+        "SQLITE_TUNED": tuned,
+        "BCRYPT_ROUNDS": str(args.bcrypt_rounds),
+        "UPLOAD_DIR": os.path.join(workdir, "uploads"),
+        "API_KEY": "",
+        "API_KEYS": "",
+    }
+    server = start_server(database_url, port, args.workers, env_overrides)
+    try:
+        await wait_until_healthy(base_url)
+        async with httpx.AsyncClient(base_url=base_url) as client:
+            response = await client.post("/api/auth/login", json={"email": email, "password": SEED_PASSWORD})
+            response.raise_for_status()
+            make_request = mixed_request({"Authorization": f"Bearer {response.json()['access_token']}"})
+        await run_scenario(base_url, make_request, args.concurrency * 2, args.concurrency)
+        result = await run_scenario(base_url, make_request, args.requests, args.concurrency)
+        result["server_rss_bytes"] = rss_bytes(server.pid)
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+    return result
+
+
+async def main_async(args) -> dict:
+    workdir = tempfile.mkdtemp(prefix="poc-bench-")
+    seeded = os.path.join(workdir, "seed.db")
+    os.environ["BCRYPT_ROUNDS"] = str(args.bcrypt_rounds)
+    print(f"Seeding {args.users} users into {seeded}")
+    emails = seed_database(f"sqlite:///{seeded}", args.users, args.configs)
+
+    results = {}
+    for mode, tuned in MODES.items():
+        # Each mode starts from the same data; tuned mode switches its copy to WAL
+        path = os.path.join(workdir, f"{mode}.db")
+        shutil.copyfile(seeded, path)
+        result = await run_mode(f"sqlite:///{path}", tuned, emails[0], args, workdir)
+        results[f"mixed_{mode}"] = result
+        latency = result["latency"]
+        failed = sum(count for status, count in result["status_codes"].items() if not status.startswith("2"))
+        print(f"{mode:>8}: {result['throughput_rps']:8.1f} req/s  p50 {latency['p50_ms']:7.2f} ms  "
+              f"p95 {latency['p95_ms']:7.2f} ms  p99 {latency['p99_ms']:7.2f} ms  failed {failed}  {result['status_codes']}")
+
+    untuned, tuned = results["mixed_untuned"], results["mixed_tuned"]
+    if untuned["throughput_rps"]:
+        print(f"tuned/untuned throughput: {tuned['throughput_rps'] / untuned['throughput_rps']:.2f}x")
+
+    return {
+        "environment": environment(),
+        "parameters": {
+            "database": "sqlite",
+            "users": args.users,
+            "configs": args.configs,
+            "concurrency": args.concurrency,
+            "requests": args.requests,
+            "workers": args.workers,
+            "bcrypt_rounds": args.bcrypt_rounds,
+        },
+        "scenarios": results,
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--configs", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--workers", type=int, default=1, help="server worker processes (app.server)")
+    parser.add_argument("--bcrypt-rounds", type=int, default=4, help="Only the initial login hashes")
+    parser.add_argument("--output", help="Result file (default: benchmarks/results/sqlite_mode-<rev>-<time>.json)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    payload = asyncio.run(main_async(args))
+    print(f"Results written to {save_results('sqlite_mode', payload, args.output)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -47,7 +47,17 @@ export const userAPI = {
       headers: { 'Content-Type': 'multipart/form-data' },
     });
   },
-  listUsers: () => api.get('/users/'),
+  // Follows X-Next-Cursor until the last page so callers get every user
+  listUsers: async (params = {}) => {
+    const users = [];
+    let cursor;
+    do {
+      const res = await api.get('/users/', { params: { ...params, cursor, limit: 500 } });
+      users.push(...res.data);
+      cursor = res.headers['x-next-cursor'];
+    } while (cursor);
+    return { data: users };
+  },
   updateRole: (userId, role) => api.put(`/users/${userId}/role`, { role }),
 };
 